@@ -25,9 +25,9 @@ users = [
 users = sorted(users. key=lambda user: user['first_name'].lower())
 
 # good way
-def get_user_name(users):
-    """Get name of the user in lower case"""
-    return users["first_name"].lower()
+# get_user_name and sort_users_by_name live in timed_examples.py so the
+# benchmark suite in chapter 3 times the same code
+from timed_examples import get_user_name, sort_users_by_name
 
 def get_sorted_dictionary(users):
     """Sort the nested dictionary"""
@@ -36,10 +36,77 @@ def get_sorted_dictionary(users):
     if not len(users):
         raise ValueError("Empty dictionary")
 
-    users_by_name = sorted(users, key=get_user_name)
+    users_by_name = sort_users_by_name(users)
     return users_by_name
 
 
+# sorting a lot of users
+# ------------------------------------------------------------------------------
+# when you only want the first N users by name dont sort the whole list,
+# heapq.nsmallest keeps a heap of N items and works out each key once per user
+# when the user list doesnt even fit in memory you can do an external merge
+# sort, sort chunks that do fit, spill each sorted run to a temp file and then
+# heapq.merge the runs back together lazily
+# the case folded key is worked out once per user and stored next to it in the
+# run so the merge never calls lower() again
+# ------------------------------------------------------------------------------
+import heapq
+import pickle
+import tempfile
+from itertools import count, islice
+
+
+def get_user_key(user):
+    """Get the case folded name of the user to sort by."""
+    return user["first_name"].casefold()
+
+
+def first_users_by_name(users, number):
+    """Get the first number users by name without sorting all of them."""
+    return heapq.nsmallest(number, users, key=get_user_key)
+
+
+def _write_run(decorated):
+    run = tempfile.TemporaryFile()
+    pickler = pickle.Pickler(run, protocol=pickle.HIGHEST_PROTOCOL)
+    for item in decorated:
+        pickler.dump(item)
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    unpickler = pickle.Unpickler(run)
+    while True:
+        try:
+            yield unpickler.load()
+        except EOFError:
+            return
+
+
+def external_sort_users(users, run_size=100_000):
+    """Sort users by name spilling sorted runs to temp files as it goes."""
+    # the running index keeps equal names stable and stops the dicts
+    # themselves from ever being compared
+    position = count()
+    users = iter(users)
+    runs = []
+    try:
+        while True:
+            chunk = [(get_user_key(user), next(position), user)
+                     for user in islice(users, run_size)]
+            if not chunk:
+                break
+            chunk.sort()
+            runs.append(_write_run(chunk))
+            del chunk
+        for _, _, user in heapq.merge(*(_read_run(run) for run in runs)):
+            yield user
+    finally:
+        for run in runs:
+            run.close()
+
+
 # breaking code into helper functions makes complex code more readable
 # and easier to debug when you hit an error
 
@@ -65,16 +132,10 @@ with open("employee.csv", mode="r") as csv_file:
 # if you want to handle a specific exception or want to read more data from
 # a CSV file you can further break down this function to follow a single
 # responsibility principle
-def process_salary(csv_reader):
-    """Process salary of user from csv file."""
-    line_count = 0
-    for row in csv_reader:
-        if line_count == 0:
-            print(f'Column names are {", ".join(row)}')
-            line_count += 1
-        print(f'\t{row["name"]} salary: {row["salary"]}')
-        line_count += 1
-    print(f'Completed {line_count} lines.')
+# process_salary lives in timed_examples.py so the benchmark suite in chapter 3
+# times the same code, it is the same loop as above with the with open split out
+# (out is where it prints to, sys.stdout by default)
+from timed_examples import process_salary
 
 
 with open('employee.txt', mode='r') as csv_file:
@@ -82,6 +143,140 @@ with open('employee.txt', mode='r') as csv_file:
     line_count = 0
     process_salary(csv_reader)
 
+# Streaming the salary file in column batches
+# ------------------------------------------------------------------------------
+# DictReader builds a brand new dict for every row, fine for a small file but
+# with tens of millions of rows that is where all the time and memory goes
+# instead read the file in fixed size chunks of rows and keep each column in an
+# array, only one chunk is ever held in memory so memory stays flat no matter
+# how big the file gets
+# the totals, per month counts and min/max get worked out per batch and then
+# folded into the running result
+# salaries can be written like "60K" or "2M", rows with a salary that still
+# doesnt parse (blank, typo) or with missing columns are skipped and counted in
+# stats.skipped instead of stopping the whole file, blank lines are just skipped
+# process_salary above is still the simple per row version for small files,
+# process_salary_stream is a separate entry point for the big ones
+# ------------------------------------------------------------------------------
+import calendar
+from array import array
+from itertools import islice
+
+SALARY_UNITS = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}
+MONTH_NUMBERS = {name.lower(): number
+                 for number, name in enumerate(calendar.month_name) if name}
+
+
+class SalaryBatch:
+    """Array backed columns for one chunk of the employee file."""
+    __slots__ = ("names", "salaries", "months", "skipped")
+
+    def __init__(self):
+        self.names = []
+        self.salaries = array("d")
+        self.months = array("b")
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.salaries)
+
+
+class SalaryStats:
+    """Running salary aggregates folded together batch by batch."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.lowest = None
+        self.highest = None
+        self.per_month = array("q", [0] * 13)  # index 0 is unknown month
+        self.skipped = 0
+
+    def update(self, batch):
+        self.skipped += batch.skipped
+        if not len(batch):
+            return
+        lowest, highest = min(batch.salaries), max(batch.salaries)
+        self.count += len(batch)
+        self.total += sum(batch.salaries)
+        if self.lowest is None or lowest < self.lowest:
+            self.lowest = lowest
+        if self.highest is None or highest > self.highest:
+            self.highest = highest
+        for month in batch.months:
+            self.per_month[month] += 1
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+def parse_salary(value):
+    """Turn a salary like '60000', '60K' or '2M' into a float."""
+    value = value.strip()
+    multiplier = SALARY_UNITS.get(value[-1:].upper())
+    if multiplier:
+        return float(value[:-1]) * multiplier
+    return float(value)
+
+
+def month_number(value):
+    """Turn a birthday month like 'November' or '11' into 1-12, 0 if unknown."""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return number if 1 <= number <= 12 else 0
+    return MONTH_NUMBERS.get(value.lower(), 0)
+
+
+def read_salary_batches(csv_file, chunk_size=65536):
+    """Read the employee csv file as SalaryBatch chunks of chunk_size rows."""
+    csv_reader = csv.reader(csv_file)
+    header = next(csv_reader, None)
+    if header is None:
+        return
+    name_col = header.index("name")
+    salary_col = header.index("salary")
+    month_col = header.index("birthday month")
+    min_len = max(name_col, salary_col, month_col) + 1
+    while True:
+        rows = list(islice(csv_reader, chunk_size))
+        if not rows:
+            return
+        batch = SalaryBatch()
+        for row in rows:
+            if not row:
+                continue
+            # cut off rows dont have all the columns
+            if len(row) < min_len:
+                batch.skipped += 1
+                continue
+            try:
+                salary = parse_salary(row[salary_col])
+            except ValueError:
+                batch.skipped += 1
+                continue
+            batch.names.append(row[name_col])
+            batch.salaries.append(salary)
+            batch.months.append(month_number(row[month_col]))
+        del rows
+        yield batch
+
+
+def process_salary_stream(csv_file, chunk_size=65536):
+    """Process the salary file batch by batch and return the aggregates."""
+    stats = SalaryStats()
+    for batch in read_salary_batches(csv_file, chunk_size):
+        stats.update(batch)
+    return stats
+
+
+with open("employee.csv", mode="r", newline="") as csv_file:
+    stats = process_salary_stream(csv_file)
+    print(f"Completed {stats.count} lines, total salary {stats.total}, "
+          f"min {stats.lowest}, max {stats.highest}, "
+          f"skipped {stats.skipped} bad lines.")
+
 # wherever you are concerned about performance use ''.join() instead of inplace
 # string concatenation, the join method guarantees leaner time concatenation
 # accross various python implementations
@@ -94,6 +289,119 @@ full_name = first_name + ' ' + last_name
 # good way
 full_name = ' '.join([first_name, last_name])
 
+
+# building a big report
+# ------------------------------------------------------------------------------
+# join only helps if you already have all the pieces in a list, for a report
+# with millions of lines you dont want the whole report in memory either
+# ReportWriter appends every line into one growing bytearray and only writes it
+# out to the file descriptor once it is bigger than block_size, so there is no
+# new string per concatenation and no write syscall per line
+# in the benchmark below the time comes out about the same as join, the win is
+# that the peak memory stays around block_size instead of the whole report
+# ------------------------------------------------------------------------------
+import os
+import timeit
+import tracemalloc
+
+
+class ReportWriter:
+    """Buffer report lines in a bytearray and write them out in big blocks."""
+
+    def __init__(self, fd, block_size=1 << 20, encoding="utf-8"):
+        self.fd = fd
+        self.block_size = block_size
+        self.encoding = encoding
+        self.buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def write(self, text):
+        self.buffer += text.encode(self.encoding)
+        if len(self.buffer) >= self.block_size:
+            self.flush()
+
+    def write_header(self, columns):
+        self.write("Column names are ")
+        for index, column in enumerate(columns):
+            if index:
+                self.buffer += b", "
+            self.write(column)
+        self.buffer += b"\n"
+
+    def write_salary(self, name, salary):
+        self.buffer += f"\t{name} salary: {salary}\n".encode(self.encoding)
+        if len(self.buffer) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        written = 0
+        with memoryview(self.buffer) as view:
+            while written < len(view):
+                written += os.write(self.fd, view[written:])
+        self.buffer.clear()
+
+
+def write_salary_report(csv_reader, fd):
+    """Write the process_salary report for a DictReader to a file descriptor."""
+    with ReportWriter(fd) as writer:
+        writer.write_header(csv_reader.fieldnames)
+        line_count = 1
+        for row in csv_reader:
+            writer.write_salary(row["name"], row["salary"])
+            line_count += 1
+        writer.write(f"Completed {line_count} lines.\n")
+
+
+def _report_with_concat(rows):
+    report = "Column names are name, salary\n"
+    for name, salary in rows:
+        report += "\t" + name + " salary: " + salary + "\n"
+    return report
+
+
+def _report_with_join(rows):
+    return "".join(["Column names are name, salary\n"]
+                   + ["\t" + name + " salary: " + salary + "\n"
+                      for name, salary in rows])
+
+
+def _report_with_writer(rows, fd):
+    with ReportWriter(fd) as writer:
+        writer.write_header(["name", "salary"])
+        for name, salary in rows:
+            writer.write_salary(name, salary)
+
+
+def compare_report_building(size=100_000, repeat=5):
+    """Time concat vs join vs ReportWriter and show their peak memory."""
+    rows = [(f"user{index}", str(index * 10)) for index in range(size)]
+    fd = os.open(os.devnull, os.O_WRONLY)
+    try:
+        timings = {
+            "concat": lambda: os.write(fd, _report_with_concat(rows).encode()),
+            "join": lambda: os.write(fd, _report_with_join(rows).encode()),
+            "writer": lambda: _report_with_writer(rows, fd),
+        }
+        for name, build in timings.items():
+            best = min(timeit.repeat(build, number=1, repeat=repeat))
+            tracemalloc.start()
+            build()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:>6}: {best * 1000:.1f} ms, peak {peak / 2 ** 20:.1f} MiB "
+                  f"for {size} lines")
+    finally:
+        os.close(fd)
+
+
+if __name__ == "__main__":
+    compare_report_building()
+
 # consider using 'is' and 'is not'
 # always use 'is' or 'is not' for comparisons with None
 
@@ -199,6 +507,191 @@ def call_weather_api(url, location):
     pass
 
 
+# a real weather client
+# ------------------------------------------------------------------------------
+# one blocking request per city is far too slow when a dashboard asks for
+# thousands of cities, so the client below
+# keeps a pool of keep-alive connections and reuses them between requests
+# runs the requests concurrently on asyncio, the blocking http.client calls go
+# to a thread pool the same size as the connection pool
+# caches results by location with a time to live and a max size (LRU)
+# shares one in flight request between everyone asking for the same city
+# (single flight) so a city is only ever fetched once at a time
+# it only needs a base url so it can be pointed at a local stub server in tests
+# ------------------------------------------------------------------------------
+import asyncio
+import http.client
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+
+class WeatherAPIError(Exception):
+    """Raise the exception when the weather api does not return the weather."""
+    def __init__(self, message=None, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class TTLCache:
+    """LRU cache where every entry also expires after ttl seconds."""
+
+    def __init__(self, ttl=300, maxsize=10_000, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires <= self.clock():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (self.clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class ConnectionPool:
+    """Pool of keep-alive http connections to a single host."""
+
+    def __init__(self, url, size=20, timeout=10):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port,
+                                               timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port,
+                                          timeout=self.timeout)
+
+    def request(self, path):
+        """Make a GET request and return (status, body)."""
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = None
+        if connection is None:
+            connection = self._connect()
+            response, body = self._get(connection, path)
+        else:
+            try:
+                response, body = self._get(connection, path)
+            except (http.client.HTTPException, OSError):
+                # the server may have closed the idle connection, retry once
+                # on a fresh one, a fresh connection failing is a real error
+                connection = self._connect()
+                response, body = self._get(connection, path)
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self._idle.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+        return response.status, body
+
+    @staticmethod
+    def _get(connection, path):
+        # the connection is closed if the request fails in any way
+        succeeded = False
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            body = response.read()
+            succeeded = True
+        finally:
+            if not succeeded:
+                connection.close()
+        return response, body
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class WeatherClient:
+    """Concurrent, cached weather api client."""
+
+    def __init__(self, url, ttl=300, maxsize=10_000, connections=20):
+        self.path = urlsplit(url).path.rstrip("/")
+        self.cache = TTLCache(ttl=ttl, maxsize=maxsize)
+        self.pool = ConnectionPool(url, size=connections)
+        self._executor = ThreadPoolExecutor(max_workers=connections)
+        self._in_flight = {}
+
+    async def get_weather(self, location):
+        """Get the weather of a location from the cache or the api."""
+        weather = self.cache.get(location)
+        if weather is not None:
+            return weather
+        task = self._in_flight.get(location)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(location))
+            self._in_flight[location] = task
+            task.add_done_callback(
+                lambda _: self._in_flight.pop(location, None))
+        # shield so one caller giving up doesnt cancel it for everyone else
+        return await asyncio.shield(task)
+
+    async def get_many(self, locations):
+        """Get the weather for many locations at once.
+
+        Returns a dict of location to weather, or to the exception raised for
+        that location.
+        """
+        locations = list(dict.fromkeys(locations))
+        results = await asyncio.gather(
+            *(self.get_weather(location) for location in locations),
+            return_exceptions=True)
+        return dict(zip(locations, results))
+
+    async def _fetch(self, location):
+        loop = asyncio.get_running_loop()
+        path = f"{self.path}/{quote(location)}"
+        status, body = await loop.run_in_executor(
+            self._executor, self.pool.request, path)
+        if status != 200:
+            raise WeatherAPIError(f"No weather found for {location}", status)
+        weather = body.decode()
+        self.cache.set(location, weather)
+        return weather
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+
+def call_weather_api_many(url, locations):
+    """Get the weather of many locations concurrently."""
+    client = WeatherClient(url)
+    try:
+        return asyncio.run(client.get_many(locations))
+    finally:
+        client.close()
+
+
 # module level docstrings
 # put at the top of the file to describe the use of the module briefly
 # these comments should be before the import as well
@@ -273,6 +766,96 @@ def read_file(file_name):
     return data
 
 
+# scanning very big log files
+# ------------------------------------------------------------------------------
+# for multi GB logs even the generator version is slow as every line gets
+# decoded into a str just to look at the first two characters
+# mmap lets you treat the file as one big bytes object without reading it into
+# memory, the file gets split into shards that always end on a newline and each
+# shard is scanned by a worker process on the raw bytes
+# executor.map hands the results back in shard order so the offsets come out
+# sorted, with workers=1 the same scan runs in this process and gives the same
+# output
+# ------------------------------------------------------------------------------
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def shard_bounds(file_name, shards):
+    """Split the file into (start, end) ranges that end on a newline."""
+    size = os.path.getsize(file_name)
+    if not size:
+        return []
+    with open(file_name, "rb") as fread, \
+            mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        bounds = []
+        start = 0
+        for shard in range(1, shards + 1):
+            end = size * shard // shards
+            if end < size:
+                newline = mapped.find(b"\n", end)
+                end = size if newline == -1 else newline + 1
+            if end > start:
+                bounds.append((start, end))
+                start = end
+            if start >= size:
+                break
+        return bounds
+
+
+def scan_shard(file_name, start, end, prefix=b">>"):
+    """Return the offsets of lines in [start, end) that start with prefix."""
+    needle = b"\n" + prefix
+    offsets = []
+    with open(file_name, "rb") as fread, \
+            mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if mapped[start:start + len(prefix)] == prefix:
+            offsets.append(start)
+        # a newline at end - 1 starts a line in the next shard
+        stop = min(end - 2 + len(needle), len(mapped))
+        position = mapped.find(needle, start, stop)
+        while position != -1:
+            offsets.append(position + 1)
+            position = mapped.find(needle, position + 1, stop)
+    return offsets
+
+
+def scan_log(file_name, prefix=b">>", workers=None):
+    """Yield the offsets of all lines starting with prefix, in file order."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        size = os.path.getsize(file_name)
+        if size:
+            yield from scan_shard(file_name, 0, size, prefix)
+        return
+    bounds = shard_bounds(file_name, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(scan_shard,
+                                [file_name] * len(bounds),
+                                [start for start, _ in bounds],
+                                [end for _, end in bounds],
+                                [prefix] * len(bounds))
+        for offsets in results:
+            yield from offsets
+
+
+def read_marked_lines(file_name, prefix=b">>", workers=None):
+    """Yield the raw bytes of every line starting with prefix."""
+    with open(file_name, "rb") as fread:
+        if not os.fstat(fread.fileno()).st_size:
+            return
+        with mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in scan_log(file_name, prefix, workers):
+                end = mapped.find(b"\n", offset)
+                yield mapped[offset:] if end == -1 else mapped[offset:end]
+
+
+if __name__ == "__main__":
+    for line in read_marked_lines("logfile.txt"):
+        print(line.decode())
+
+
 # raising a exception
 def division(dividend, divisor):
     """Perform airthmetic division."""
@@ -284,7 +867,7 @@ def division(dividend, divisor):
 # custom exception
 class UserNotFoundError(Exception):
     """Raise the exception when user not found."""
-    def __init__(self, message=None, erros=None):
+    def __init__(self, message=None, errors=None):
         # Calling the base class constructor with the parameter it needs
         super().__init__(message)
         # New for your custom code
@@ -299,10 +882,95 @@ def get_user_info(user_obj):
 
 get_user_info(user_obj)
 
+
+# looking up lots of users at once
+# ------------------------------------------------------------------------------
+# calling get_user_from_db once per user means one round trip per user and under
+# load the same missing ids get asked for over and over again
+# UserLookup takes a function that fetches many ids in one round trip and keeps
+# a bounded cache (the TTLCache from the weather client) of ids that are known to
+# be missing, so asking for them again raises UserNotFoundError straight away
+# without touching the store
+# it also counts hits, misses and how long the store took
+# ------------------------------------------------------------------------------
+class UserLookupStats:
+    """Counters for the user lookups."""
+    __slots__ = ("hits", "misses", "cached_misses", "round_trips", "latency")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.cached_misses = 0
+        self.round_trips = 0
+        self.latency = 0.0
+
+    @property
+    def average_latency(self):
+        return self.latency / self.round_trips if self.round_trips else 0.0
+
+
+class UserLookup:
+    """Batched user lookups with a negative cache of missing ids.
+
+    fetch_users takes a list of ids and returns a dict of id to user for the
+    ids it found, in a single round trip to the store.
+    """
+
+    def __init__(self, fetch_users, missing_ttl=60, missing_maxsize=100_000):
+        self.fetch_users = fetch_users
+        self.missing = TTLCache(ttl=missing_ttl, maxsize=missing_maxsize)
+        self.stats = UserLookupStats()
+
+    def get_users(self, user_ids):
+        """Get users by id, returns (found, missing).
+
+        found is a dict of id to user and missing a list of ids not in the store.
+        """
+        found = {}
+        missing = []
+        to_fetch = []
+        for user_id in dict.fromkeys(user_ids):
+            if self.missing.get(user_id):
+                self.stats.cached_misses += 1
+                missing.append(user_id)
+            else:
+                to_fetch.append(user_id)
+        if to_fetch:
+            started = time.perf_counter()
+            users = self.fetch_users(to_fetch)
+            self.stats.latency += time.perf_counter() - started
+            self.stats.round_trips += 1
+            for user_id in to_fetch:
+                if user_id in users:
+                    self.stats.hits += 1
+                    found[user_id] = users[user_id]
+                else:
+                    self.stats.misses += 1
+                    self.missing.set(user_id, True)
+                    missing.append(user_id)
+        return found, missing
+
+    def get_user(self, user_id):
+        """Get a single user or raise UserNotFoundError."""
+        found, _ = self.get_users([user_id])
+        if user_id not in found:
+            raise UserNotFoundError(f"No user found of this id: {user_id}",
+                                    [user_id])
+        return found[user_id]
+
+
+def get_users_info(user_objs, lookup):
+    """Get user information from DB for many users in one round trip."""
+    found, missing = lookup.get_users([user_obj.id for user_obj in user_objs])
+    if missing:
+        raise UserNotFoundError(f"No users found of these ids: {missing}",
+                                missing)
+    return found
+
 # broader custom exception
 class WrongInstanceIDError(Exception):
     """Raise the exception whenever Invalid instance found."""
-    def __init__(self, message=None, errros=None):
+    def __init__(self, message=None, errors=None):
         # Calling the base class constructor with the parameter it needs
         super().__init__(message)
         # New for your custom code
@@ -317,3 +985,75 @@ except ClientError as e:
     # Only worry about a specific service error code
     if e.response['Error']['Code'] == 'InvalidInstanceID.NotFound':
         raise WrongInstanceIDError(message=exc_info, errors=e)
+
+
+# describing a whole fleet of instances
+# ------------------------------------------------------------------------------
+# one instance id per call is way too slow when auditing tens of thousands of
+# instances, describe_instances takes up to 1000 ids per call so the ids get
+# split into batches of that size which run on a small thread pool
+# if one bad id is in a batch the whole call fails with NotFound, so instead of
+# failing everything the batch gets split in half again and again until the
+# bad ids are found, the good halves still come back
+# the ec2 client is passed in so a fake client can be used in tests
+# ------------------------------------------------------------------------------
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+MAX_INSTANCE_IDS_PER_CALL = 1000
+
+
+def _error_code(error):
+    return error.response.get("Error", {}).get("Code")
+
+
+def _describe_pages(ec2, instance_ids):
+    instances = []
+    kwargs = {"InstanceIds": instance_ids}
+    while True:
+        parsed = ec2.describe_instances(**kwargs)
+        for reservation in parsed.get("Reservations", []):
+            instances.extend(reservation.get("Instances", []))
+        next_token = parsed.get("NextToken")
+        if not next_token:
+            return instances
+        kwargs["NextToken"] = next_token
+
+
+def _describe_batch(ec2, instance_ids):
+    """Describe one batch, bisecting it to isolate any ids that dont exist."""
+    try:
+        return _describe_pages(ec2, instance_ids), []
+    except ClientError as e:
+        if _error_code(e) != "InvalidInstanceID.NotFound":
+            raise
+        if len(instance_ids) == 1:
+            return [], instance_ids
+    middle = len(instance_ids) // 2
+    left, left_missing = _describe_batch(ec2, instance_ids[:middle])
+    right, right_missing = _describe_batch(ec2, instance_ids[middle:])
+    return left + right, left_missing + right_missing
+
+
+def describe_instances(ec2, instance_ids, batch_size=MAX_INSTANCE_IDS_PER_CALL,
+                       workers=8):
+    """Describe many instances, returns (instances, invalid instance ids)."""
+    instance_ids = list(dict.fromkeys(instance_ids))
+    batches = [instance_ids[start:start + batch_size]
+               for start in range(0, len(instance_ids), batch_size)]
+    instances = []
+    invalid_ids = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for found, missing in executor.map(
+                lambda batch: _describe_batch(ec2, batch), batches):
+            instances.extend(found)
+            invalid_ids.extend(missing)
+    return instances, invalid_ids
+
+
+instances, invalid_ids = describe_instances(ec2, instance_ids)
+if invalid_ids:
+    logger.error("Invalid instance ids: %s", invalid_ids)
+    raise WrongInstanceIDError(f"Invalid instance ids: {invalid_ids}",
+                               invalid_ids)
@@ -13,6 +13,237 @@
 # because it will make your code much faster
 # sets are useful when you need to access items frequently
 # ------------------------------------------------------------------------------
+# Compact sets
+# ------------------------------------------------------------------------------
+# a set of tens of millions of strings costs gigabytes as every string is its
+# own python object, if you only need to ask "have I seen this?" you can store
+# just a 64 bit hash of every item instead
+# CompactSet keeps the hashes in one array('Q') hash table (open addressing with
+# linear probing), that is 8 bytes per slot and the table is kept at most half
+# full, the catch is two different items could in theory have the same 64 bit
+# hash, which is fine for a membership check but means you cant get the items
+# back out
+# items have to be str or bytes, "a" and b"a" are different items just like in
+# a normal set, and asking about anything else is simply not in the set
+# bloom_bits adds a bloom filter in front of the table, a miss in the filter
+# means the item is definitely not there without touching the table
+# save() writes it to a file and CompactSet.load() maps the file back in with
+# mmap, so several worker processes can share one copy (loaded sets are read
+# only), the file uses the byte order of the machine that saved it, close() (or
+# a with block) unmaps it again
+# ------------------------------------------------------------------------------
+import hashlib
+import mmap
+import struct
+from array import array
+
+_HEADER = struct.Struct("<8sQQQQ")
+_MAGIC = b"CMPSET02"
+
+
+def hash64(item):
+    """Stable 64 bit hash of a str or bytes item, never 0."""
+    # the person argument keeps "a" and b"a" apart
+    if isinstance(item, str):
+        digest = hashlib.blake2b(item.encode(), digest_size=8, person=b"str")
+    elif isinstance(item, (bytes, bytearray, memoryview)):
+        digest = hashlib.blake2b(item, digest_size=8, person=b"bytes")
+    else:
+        raise TypeError(f"CompactSet items must be str or bytes, "
+                        f"not {type(item).__name__}")
+    return int.from_bytes(digest.digest(), "little") or 1
+
+
+class BloomFilter:
+    """Bloom filter over 64 bit hashes."""
+
+    def __init__(self, bits, hashes=4, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray((bits + 7) // 8) if data is None else data
+
+    def _positions(self, value):
+        first, second = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [(first + index * second) % self.bits
+                for index in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.data[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class CompactSet:
+    """Membership set that only stores 64 bit hashes of its items."""
+
+    def __init__(self, items=(), capacity=1024, bloom_bits=0):
+        size = 8
+        while size < capacity:
+            size *= 2
+        self._table = array("Q", bytes(8 * size))
+        self._count = 0
+        self._mmap = None
+        self.bloom = BloomFilter(bloom_bits) if bloom_bits else None
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, item):
+        try:
+            value = hash64(item)
+        except TypeError:
+            return False
+        return self._has_hash(value)
+
+    def __or__(self, other):
+        if not isinstance(other, CompactSet):
+            return NotImplemented
+        return self.union(other)
+
+    def __and__(self, other):
+        if not isinstance(other, CompactSet):
+            return NotImplemented
+        return self.intersection(other)
+
+    def add(self, item):
+        self._add_hash(hash64(item))
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def union(self, other):
+        other = self._as_compact_set(other)
+        result = self._empty_like(len(self) + len(other))
+        for value in self._hashes():
+            result._add_hash(value)
+        for value in other._hashes():
+            result._add_hash(value)
+        return result
+
+    def intersection(self, other):
+        other = self._as_compact_set(other)
+        smaller, bigger = sorted((self, other), key=len)
+        result = self._empty_like(len(smaller))
+        for value in smaller._hashes():
+            if bigger._has_hash(value):
+                result._add_hash(value)
+        return result
+
+    def save(self, path):
+        bloom_bits = self.bloom.bits if self.bloom else 0
+        bloom_hashes = self.bloom.hashes if self.bloom else 0
+        with open(path, "wb") as fwrite:
+            fwrite.write(_HEADER.pack(_MAGIC, len(self._table), self._count,
+                                      bloom_bits, bloom_hashes))
+            fwrite.write(self._table)
+            if self.bloom:
+                fwrite.write(self.bloom.data)
+
+    @classmethod
+    def load(cls, path):
+        """Map a saved set into memory without copying it, read only."""
+        with open(path, "rb") as fread:
+            mapped = mmap.mmap(fread.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, count, bloom_bits, bloom_hashes = _HEADER.unpack_from(
+            mapped)
+        if magic != _MAGIC:
+            mapped.close()
+            raise ValueError(f"{path} is not a saved CompactSet")
+        start = _HEADER.size
+        compact_set = cls.__new__(cls)
+        compact_set._mmap = mapped
+        compact_set._count = count
+        compact_set.bloom = None
+        # only the slices below stay alive, close() releases them
+        with memoryview(mapped) as view:
+            with view[start:start + 8 * size] as table:
+                compact_set._table = table.cast("Q")
+            if bloom_bits:
+                start += 8 * size
+                compact_set.bloom = BloomFilter(
+                    bloom_bits, bloom_hashes,
+                    view[start:start + (bloom_bits + 7) // 8])
+        return compact_set
+
+    def close(self):
+        """Unmap a loaded set, it cant be used afterwards."""
+        if self._mmap is None:
+            return
+        # the views have to go before the mmap can be closed
+        if self.bloom is not None:
+            self.bloom.data.release()
+            self.bloom = None
+        self._table.release()
+        self._table = array("Q", bytes(8 * 8))
+        self._count = 0
+        self._mmap.close()
+        self._mmap = None
+
+    def _as_compact_set(self, items):
+        if isinstance(items, CompactSet):
+            return items
+        items = list(items)
+        return CompactSet(items, capacity=2 * len(items))
+
+    def _empty_like(self, count):
+        bloom_bits = self.bloom.bits if self.bloom else 0
+        return CompactSet(capacity=2 * count, bloom_bits=bloom_bits)
+
+    def _hashes(self):
+        return (value for value in self._table if value)
+
+    def _slot(self, value):
+        table = self._table
+        mask = len(table) - 1
+        index = value & mask
+        while True:
+            slot = table[index]
+            if slot == 0 or slot == value:
+                return index
+            index = (index + 1) & mask
+
+    def _has_hash(self, value):
+        if self.bloom is not None and value not in self.bloom:
+            return False
+        return self._table[self._slot(value)] == value
+
+    def _add_hash(self, value):
+        if self._mmap is not None:
+            raise TypeError("a loaded CompactSet is read only")
+        index = self._slot(value)
+        if self._table[index]:
+            return
+        self._table[index] = value
+        self._count += 1
+        if self.bloom is not None:
+            self.bloom.add(value)
+        if 2 * self._count > len(self._table):
+            self._grow()
+
+    def _grow(self):
+        old_table = self._table
+        self._table = array("Q", bytes(16 * len(old_table)))
+        for value in old_table:
+            if value:
+                self._table[self._slot(value)] = value
+
+
+user_names = CompactSet(["Abe", "Larry", "Adams"], bloom_bits=1 << 16)
+"Larry" in user_names
+#>>> True
+# ------------------------------------------------------------------------------
 
 # NAMES TUPLES
 # ------------------------------------------------------------------------------
@@ -56,6 +287,161 @@ point.x
 point.y
 point.z
 #-------------------------------------------------------------------------------
+# Millions of points
+# ------------------------------------------------------------------------------
+# with millions of points the object per point is what costs the most memory
+# PointArray keeps x, y and z in three array('d') columns, so a point is just
+# 24 bytes, and works on whole columns at once for distances, centroid and
+# bounding box
+# nearest neighbour queries use a k-d tree that is built the first time you
+# ask and thrown away when points are added
+# indexing still gives you back a Point namedtuple so the rest of your code
+# doesnt need to change
+# ------------------------------------------------------------------------------
+import heapq
+import math
+from array import array
+
+
+class KDTree:
+    """k-d tree over the x, y and z columns of a PointArray."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.point_index = array("q")
+        self.axis = array("b")
+        self.left = array("q")
+        self.right = array("q")
+        self.root = self._build(list(range(len(columns[0]))), 0)
+
+    def _build(self, indices, depth):
+        if not indices:
+            return -1
+        axis = depth % 3
+        indices.sort(key=self.columns[axis].__getitem__)
+        middle = len(indices) // 2
+        node = len(self.point_index)
+        self.point_index.append(indices[middle])
+        self.axis.append(axis)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.left[node] = self._build(indices[:middle], depth + 1)
+        self.right[node] = self._build(indices[middle + 1:], depth + 1)
+        return node
+
+    def nearest(self, point, k=1):
+        """Get the k nearest points as a sorted list of (distance, index)."""
+        if k <= 0:
+            return []
+        best = []  # max heap of (-squared distance, -index)
+        columns = self.columns
+
+        def search(node):
+            if node == -1:
+                return
+            index = self.point_index[node]
+            squared = sum((column[index] - value) ** 2
+                          for column, value in zip(columns, point))
+            if len(best) < k:
+                heapq.heappush(best, (-squared, -index))
+            elif squared < -best[0][0]:
+                heapq.heapreplace(best, (-squared, -index))
+            axis = self.axis[node]
+            gap = point[axis] - columns[axis][index]
+            near, far = ((self.left[node], self.right[node]) if gap < 0
+                         else (self.right[node], self.left[node]))
+            search(near)
+            if len(best) < k or gap * gap < -best[0][0]:
+                search(far)
+
+        search(self.root)
+        return sorted((math.sqrt(-squared), -index) for squared, index in best)
+
+
+class PointArray:
+    """Points stored as contiguous x, y and z columns."""
+    __slots__ = ("xs", "ys", "zs", "_tree")
+
+    def __init__(self, points=()):
+        self.xs = array("d")
+        self.ys = array("d")
+        self.zs = array("d")
+        self._tree = None
+        self.extend(points)
+
+    @classmethod
+    def from_points(cls, points):
+        return cls(points)
+
+    def to_points(self):
+        return list(self)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            points = PointArray()
+            points.xs = self.xs[index]
+            points.ys = self.ys[index]
+            points.zs = self.zs[index]
+            return points
+        return Point(self.xs[index], self.ys[index], self.zs[index])
+
+    def __iter__(self):
+        return map(Point, self.xs, self.ys, self.zs)
+
+    def append(self, point):
+        x, y, z = point
+        self.xs.append(x)
+        self.ys.append(y)
+        self.zs.append(z)
+        self._tree = None
+
+    def extend(self, points):
+        for x, y, z in points:
+            self.xs.append(x)
+            self.ys.append(y)
+            self.zs.append(z)
+        self._tree = None
+
+    def distances_to(self, point):
+        """Get the distance of every point to point as an array."""
+        px, py, pz = point
+        # math.hypot only takes three coordinates from python 3.8 on
+        sqrt = math.sqrt
+        return array("d", [sqrt((x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2)
+                           for x, y, z in zip(self.xs, self.ys, self.zs)])
+
+    def centroid(self):
+        if not self:
+            raise ValueError("centroid of no points")
+        size = len(self)
+        return Point(math.fsum(self.xs) / size, math.fsum(self.ys) / size,
+                     math.fsum(self.zs) / size)
+
+    def bounding_box(self):
+        """Get the (lowest, highest) corners of the box around all points."""
+        if not self:
+            raise ValueError("bounding box of no points")
+        return (Point(min(self.xs), min(self.ys), min(self.zs)),
+                Point(max(self.xs), max(self.ys), max(self.zs)))
+
+    def nearest(self, point, k=1):
+        """Get the k nearest points as a sorted list of (distance, index)."""
+        if k <= 0:
+            return []
+        if self._tree is None:
+            self._tree = KDTree((self.xs, self.ys, self.zs))
+        return self._tree.nearest(tuple(point), k)
+
+
+points = PointArray.from_points([Point(x=3, y=4, z=5), Point(x=0, y=0, z=0)])
+points.nearest(Point(x=1, y=1, z=1))
+#>>> [(1.7320508075688772, 1)]
+points[1].x
+#>>> 0.0
+#-------------------------------------------------------------------------------
 # Return data
 # usually you would use a tuple to return data, however, you should consider
 # using a namedtuple because it makes code much more readable
@@ -82,6 +468,190 @@ def get_full_name(user_info):
 user_info = get_user_info(user_obj)
 full_name = get_full_name(user_info)
 #-------------------------------------------------------------------------------
+# Dont build a namedtuple class inside a function
+# ------------------------------------------------------------------------------
+# calling namedtuple() inside get_user_info builds a brand new class every time
+# the function is called, which is very slow on a hot path
+# make the class once at module level, record_type caches the classes so asking
+# for the same name and fields again gives you back the same class
+# namedtuples are tuple backed and have __slots__ = () so they are already small,
+# slotted_record_type gives you a mutable version with __slots__ when you need
+# to change the values
+# ------------------------------------------------------------------------------
+import struct
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def record_type(name, fields):
+    """Get the namedtuple class for name and fields, it is only built once."""
+    return namedtuple(name, fields)
+
+
+@lru_cache(maxsize=None)
+def slotted_record_type(name, fields):
+    """Get a mutable class with __slots__ for name and fields, built once."""
+    def __init__(self, *args, **kwargs):
+        values = dict(zip(fields, args))
+        if any(field in values for field in kwargs):
+            raise TypeError(f"{name} got a field both by position and keyword")
+        values.update(kwargs)
+        if len(values) != len(fields) or len(args) > len(fields):
+            raise TypeError(f"{name} takes the fields {', '.join(fields)}")
+        for field in fields:
+            setattr(self, field, values[field])
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}"
+                           for field in fields)
+        return f"{name}({values})"
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field)
+                   for field in fields)
+
+    def __iter__(self):
+        return (getattr(self, field) for field in fields)
+
+    return type(name, (), {"__slots__": fields, "_fields": fields,
+                           "__init__": __init__, "__repr__": __repr__,
+                           "__eq__": __eq__, "__hash__": None,
+                           "__iter__": __iter__})
+
+
+UserInfo = record_type("UserInfo", ("first_name", "last_name", "age"))
+Company = record_type("Company", ("name", "employee", "location"))
+Point = record_type("Point", ("x", "y", "z"))
+
+
+def get_user_info(user_obj):
+    user = get_data_from_db(user_obj)
+    return UserInfo(first_name=user["first_name"],
+                    last_name=user["last_name"],
+                    age=user["age"])
+# ------------------------------------------------------------------------------
+# Millions of records
+# ------------------------------------------------------------------------------
+# even a namedtuple is a python object per record plus an object per value, for
+# millions of records pack them into one bytearray with struct instead
+# (an array of structs), every field has a struct code like "d" for a float
+# or "32s" for a string of up to 32 bytes
+# records[i] gives you a view that reads and writes straight from the buffer
+# without copying the record out, records.get(i) gives you a real record
+# a string that is too long for its field is cut at the last whole character
+# that fits, so a multi byte character never gets cut in half
+# ------------------------------------------------------------------------------
+class RecordView:
+    """Zero copy view of one record inside a RecordArray."""
+    __slots__ = ("_records", "_offset")
+
+    def __init__(self, records, index):
+        self._records = records
+        self._offset = index * records.record_size
+
+    def __getattr__(self, field):
+        return self._records._read_field(self._offset, field)
+
+    def __setattr__(self, field, value):
+        if field in RecordView.__slots__:
+            object.__setattr__(self, field, value)
+        else:
+            self._records._write_field(self._offset, field, value)
+
+    def __repr__(self):
+        return repr(self._records._read(self._offset))
+
+
+class RecordArray:
+    """Records packed back to back in a single bytearray.
+
+    RecordArray(Point, ("d", "d", "d")) stores points as three doubles each.
+    """
+
+    def __init__(self, record_cls, formats, encoding="utf-8"):
+        if len(formats) != len(record_cls._fields):
+            raise ValueError("Need one struct format per field")
+        self.record_cls = record_cls
+        self.encoding = encoding
+        self._struct = struct.Struct("<" + "".join(formats))
+        self._fields = {}
+        offset = 0
+        for field, code in zip(record_cls._fields, formats):
+            field_struct = struct.Struct("<" + code)
+            self._fields[field] = (offset, field_struct, code.endswith("s"))
+            offset += field_struct.size
+        self.record_size = self._struct.size
+        self._buffer = bytearray()
+
+    def __len__(self):
+        return len(self._buffer) // self.record_size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return RecordView(self, index)
+
+    def __iter__(self):
+        for offset in range(0, len(self._buffer), self.record_size):
+            yield self._read(offset)
+
+    def append(self, record):
+        self._buffer += self._struct.pack(*(
+            self._encode(value, *self._fields[field][1:])
+            for field, value in zip(self.record_cls._fields, record)))
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def get(self, index):
+        """Copy the record at index out into a record_cls."""
+        return self._read(self[index]._offset)
+
+    def _encode(self, value, field_struct, is_bytes):
+        if not is_bytes:
+            return value
+        encoded = value.encode(self.encoding)
+        if len(encoded) > field_struct.size:
+            encoded = encoded[:field_struct.size].decode(
+                self.encoding, "ignore").encode(self.encoding)
+        return encoded
+
+    def _decode(self, value, is_bytes):
+        return value.rstrip(b"\0").decode(self.encoding) if is_bytes else value
+
+    def _read(self, offset):
+        values = self._struct.unpack_from(self._buffer, offset)
+        return self.record_cls(*(
+            self._decode(value, is_bytes) for value, (_, _, is_bytes)
+            in zip(values, self._fields.values())))
+
+    def _read_field(self, offset, field):
+        try:
+            field_offset, field_struct, is_bytes = self._fields[field]
+        except KeyError:
+            raise AttributeError(field) from None
+        value, = field_struct.unpack_from(self._buffer, offset + field_offset)
+        return self._decode(value, is_bytes)
+
+    def _write_field(self, offset, field, value):
+        try:
+            field_offset, field_struct, is_bytes = self._fields[field]
+        except KeyError:
+            raise AttributeError(field) from None
+        field_struct.pack_into(self._buffer, offset + field_offset,
+                               self._encode(value, field_struct, is_bytes))
+
+
+points = RecordArray(Point, ("d", "d", "d"))
+points.append(Point(x=3, y=4, z=5))
+points[0].x
+#>>> 3.0
+#-------------------------------------------------------------------------------
 
 Understanding STR, UNICODE & BYTE
 # ------------------------------------------------------------------------------
@@ -95,6 +665,132 @@ Understanding STR, UNICODE & BYTE
 # UTF-8
 # python interpreters use UTF-8
 # ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# reading a file in text mode decodes every byte to str up front even if you
+# only ever look at a couple of fields or the first two characters of a line
+# the readers below keep the data as bytes and hand out memoryview slices of it,
+# a slice is not a copy, and only decode the fields you actually use
+# b"\n" never shows up inside a multi byte UTF-8 character so splitting lines on
+# the raw bytes is safe
+# when you do want the text decoded in chunks, an incremental decoder holds on
+# to a character that got cut in half at the end of a chunk until the next chunk
+# comes in, chunks that are pure ASCII (the common case) skip it and go through
+# the much cheaper ascii codec, that shortcut is only taken for encodings where
+# ASCII bytes mean the same thing (utf-8, latin-1, cp1252), UTF-16 and friends
+# always go through the real codec
+# the fields are split on the delimiter only, so this is for simple files and
+# not CSV files with quoted fields
+# ------------------------------------------------------------------------------
+import codecs
+
+_ASCII_SUPERSETS = {"ascii", "utf-8", "iso8859-1", "cp1252"}
+
+
+def _ascii_fast_path(encoding):
+    return codecs.lookup(encoding).name in _ASCII_SUPERSETS
+
+
+def _iter_line_bounds(fread, chunk_size):
+    # yields (data, start, end) for every line, data is only copied when a line
+    # is cut in half at the end of a chunk
+    carry = b""
+    while True:
+        chunk = fread.read(chunk_size)
+        if not chunk:
+            break
+        data = carry + chunk if carry else chunk
+        start = 0
+        end = data.find(b"\n")
+        while end != -1:
+            yield data, start, end
+            start = end + 1
+            end = data.find(b"\n", start)
+        carry = data[start:]
+    if carry:
+        yield carry, 0, len(carry)
+
+
+def iter_line_views(fread, chunk_size=1 << 20):
+    """Yield every line of a binary file as a memoryview, without the b"\\n"."""
+    view = data = None
+    for line_data, start, end in _iter_line_bounds(fread, chunk_size):
+        if line_data is not data:
+            data, view = line_data, memoryview(line_data)
+        yield view[start:end]
+
+
+def iter_records(fread, delimiter=b",", encoding="utf-8", chunk_size=1 << 20):
+    """Yield every line of a binary file as LazyFields."""
+    for data, start, end in _iter_line_bounds(fread, chunk_size):
+        yield LazyFields(data, start, end, delimiter, encoding)
+
+
+def iter_decoded_chunks(fread, encoding="utf-8", chunk_size=1 << 20):
+    """Decode a binary file chunk by chunk, safe across chunk boundaries."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    fast_path = _ascii_fast_path(encoding)
+    while True:
+        chunk = fread.read(chunk_size)
+        if not chunk:
+            break
+        pending, _ = decoder.getstate()
+        if fast_path and not pending and chunk.isascii():
+            yield chunk.decode("ascii")
+        else:
+            yield decoder.decode(chunk)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def decode_bytes(raw, encoding="utf-8"):
+    """Decode bytes, pure ASCII goes through the ascii codec if it can."""
+    if raw.isascii() and _ascii_fast_path(encoding):
+        return raw.decode("ascii")
+    return raw.decode(encoding)
+
+
+class LazyFields:
+    """Fields of one line that are only decoded when you ask for them."""
+    __slots__ = ("_data", "_bounds", "_decoded", "_encoding")
+
+    def __init__(self, data, start, end, delimiter=b",", encoding="utf-8"):
+        self._data = data
+        self._encoding = encoding
+        self._decoded = {}
+        self._bounds = []
+        position = data.find(delimiter, start, end)
+        while position != -1:
+            self._bounds.append((start, position))
+            start = position + len(delimiter)
+            position = data.find(delimiter, start, end)
+        self._bounds.append((start, end))
+
+    def __len__(self):
+        return len(self._bounds)
+
+    def raw(self, index):
+        """Get a field as a memoryview without decoding it."""
+        start, end = self._bounds[index]
+        return memoryview(self._data)[start:end]
+
+    def __getitem__(self, index):
+        try:
+            return self._decoded[index]
+        except KeyError:
+            start, end = self._bounds[index]
+            text = decode_bytes(self._data[start:end], self._encoding)
+            self._decoded[index] = text
+            return text
+
+
+def read_file(file_name, prefix=b">>"):
+    """Read the lines starting with prefix, decoding only those lines."""
+    with open(file_name, "rb") as fread:
+        for line in iter_line_views(fread):
+            if line[:len(prefix)] == prefix:
+                yield decode_bytes(line.tobytes())
+# ------------------------------------------------------------------------------
 
 # Use List carefully and prefer generators
 # ------------------------------------------------------------------------------
@@ -139,6 +835,79 @@ def get_user_salary_info():
 
     return users_salary
 # ------------------------------------------------------------------------------
+# for a lot of users dont build any lists at all
+# get the names and salaries from the db as generators, zip them lazily and
+# hand the pairs on as an iterator, only batch_size pairs are in memory at once
+# the salary strings like "2M" and "60K" are parsed a batch at a time into an
+# array of floats
+# if you need to do something expensive with every pair, pass a transform and
+# it runs on a process pool one batch at a time so the stream stays lazy
+# if one source runs out before the other you get a ValueError (zip_longest
+# with a sentinel, zip(strict=True) needs python 3.10)
+# ------------------------------------------------------------------------------
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, zip_longest
+
+_MISSING = object()
+
+SALARY_UNITS = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}
+
+
+def parse_salaries(salaries):
+    """Parse salary strings like "2M" or "60K" into an array of floats."""
+    units = SALARY_UNITS
+    parsed = array("d")
+    append = parsed.append
+    for salary in salaries:
+        salary = salary.strip()
+        multiplier = units.get(salary[-1:].upper())
+        if multiplier:
+            append(float(salary[:-1]) * multiplier)
+        else:
+            append(float(salary))
+    return parsed
+
+
+def stream_user_salaries(users, salaries, batch_size=10_000):
+    """Lazily zip user names with their parsed salaries."""
+    pairs = zip_longest(users, salaries, fillvalue=_MISSING)
+    while True:
+        batch = list(islice(pairs, batch_size))
+        if not batch:
+            return
+        # once a source runs out every pair after it has the sentinel too
+        name, salary = batch[-1]
+        if name is _MISSING or salary is _MISSING:
+            raise ValueError("users and salaries are not the same length")
+        names, raw_salaries = zip(*batch)
+        yield from zip(names, parse_salaries(raw_salaries))
+
+
+def transform_user_salaries(pairs, transform, workers=None, batch_size=10_000):
+    """Run transform on every (name, salary) pair on a process pool, in order."""
+    pairs = iter(pairs)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(islice(pairs, batch_size))
+            if not batch:
+                return
+            yield from executor.map(transform, batch,
+                                    chunksize=max(1, batch_size // 64))
+
+
+def get_user_salary_info(transform=None, batch_size=10_000):
+    users = get_users_name_from_db()
+    # ("Abe", "Larry", "Adams", "John", "Sumit", "Adward")
+
+    users_salary = get_users_salary_from_db()
+    #  ("2M", "1M", "60K", "30K", "80K", "100K")
+
+    pairs = stream_user_salaries(users, users_salary, batch_size)
+    if transform is not None:
+        return transform_user_salaries(pairs, transform, batch_size=batch_size)
+    return pairs
+# ------------------------------------------------------------------------------
 
 # Take advantage of python's built-in function
 # ------------------------------------------------------------------------------
@@ -176,12 +945,301 @@ def get_user_salary_info():
 # works well with dictionaries
 # has useful methods like most_common()
 # ------------------------------------------------------------------------------
+# when one Counter in one process is too slow, ShardedCounter splits the input
+# into chunks, counts every chunk in a worker process and splits each partial
+# count into shards by a hash of the key, the shards are then merged so every
+# key only ever lives in one shard
+# most_common(k) takes the top k of every shard with a heap and then the top k
+# of those, so nothing gets fully sorted
+# the key hash is crc32 of repr(key) and not hash() as hash() of a str is
+# different in every process
+# ------------------------------------------------------------------------------
+import heapq
+import os
+import zlib
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+
+def stable_hash(key, seed=0):
+    """Hash a key the same way in every process."""
+    return zlib.crc32(repr(key).encode(), seed)
+
+
+def _count_chunk(chunk, shards):
+    partials = [Counter() for _ in range(shards)]
+    for key, total in Counter(chunk).items():
+        partials[stable_hash(key) % shards][key] = total
+    return partials
+
+
+class ShardedCounter:
+    """Counter split into shards that are counted on a process pool."""
+
+    def __init__(self, shards=8):
+        self.shards = [Counter() for _ in range(shards)]
+
+    def __getitem__(self, key):
+        return self.shards[stable_hash(key) % len(self.shards)][key]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def total(self):
+        return sum(sum(shard.values()) for shard in self.shards)
+
+    def update(self, iterable, workers=None, chunk_size=100_000):
+        """Count the keys in iterable, workers=1 counts in this process."""
+        iterable = iter(iterable)
+        chunks = iter(lambda: list(islice(iterable, chunk_size)), [])
+        if workers == 1:
+            self.merge(_count_chunk(chunk, len(self.shards))
+                       for chunk in chunks)
+            return
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = []
+            for chunk in chunks:
+                pending.append(executor.submit(_count_chunk, chunk,
+                                               len(self.shards)))
+                # keep the number of chunks in flight bounded
+                if len(pending) >= 2 * workers:
+                    self.merge([pending.pop(0).result()])
+            self.merge(future.result() for future in pending)
+
+    def merge(self, partials):
+        """Add per shard partial counts, from _count_chunk or another counter."""
+        for partial in partials:
+            for shard, counts in zip(self.shards, partial):
+                shard.update(counts)
+
+    def most_common(self, k):
+        return heapq.nlargest(k, chain.from_iterable(
+            shard.most_common(k) for shard in self.shards),
+            key=lambda item: item[1])
+# ------------------------------------------------------------------------------
+# when there are too many different keys to keep them all, an approximate count
+# is often good enough
+# a count-min sketch is depth rows of width counters, every key adds one to a
+# counter in every row and its estimate is the smallest of those counters, it
+# never under counts and the memory is fixed whatever the number of keys
+# the heavy hitters keep the keys with the biggest estimates so most_common still
+# works, two sketches of the same size can be merged by adding them up
+# ------------------------------------------------------------------------------
+class CountMinSketch:
+    """Approximate counts in fixed memory, with the top k heavy hitters."""
+
+    def __init__(self, width=2 ** 16, depth=4, heavy_hitters=100):
+        self.width = width
+        self.depth = depth
+        self.heavy_hitters = heavy_hitters
+        self.rows = [array("q", bytes(8 * width)) for _ in range(depth)]
+        self.heavy = {}
+
+    def _columns(self, key):
+        return [stable_hash(key, seed) % self.width
+                for seed in range(self.depth)]
+
+    def add(self, key, count=1):
+        estimate = None
+        for row, column in zip(self.rows, self._columns(key)):
+            row[column] += count
+            if estimate is None or row[column] < estimate:
+                estimate = row[column]
+        self._track(key, estimate)
+
+    def update(self, iterable):
+        for key, count in Counter(iterable).items():
+            self.add(key, count)
+
+    def __getitem__(self, key):
+        return min(row[column]
+                   for row, column in zip(self.rows, self._columns(key)))
+
+    def _track(self, key, estimate):
+        self.heavy[key] = estimate
+        if len(self.heavy) > 2 * self.heavy_hitters:
+            self.heavy = dict(heapq.nlargest(self.heavy_hitters,
+                                             self.heavy.items(),
+                                             key=lambda item: item[1]))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Can only merge sketches of the same size")
+        for row, other_row in zip(self.rows, other.rows):
+            for column, count in enumerate(other_row):
+                if count:
+                    row[column] += count
+        for key in list(chain(self.heavy, other.heavy)):
+            self._track(key, self[key])
+
+    def most_common(self, k):
+        return heapq.nlargest(k, ((key, self[key]) for key in self.heavy),
+                              key=lambda item: item[1])
+# ------------------------------------------------------------------------------
 # Deque
 # if you need to create a queue or a stack
 # allows you to append or pop from the right or the left
 # make dequeue
 deq = deque('abcdefg')
 # ------------------------------------------------------------------------------
+# deque on its own does nothing about producers being faster than consumers,
+# BoundedQueue wraps a deque with a lock so threads can pass batches of work to
+# each other with put_many / get_many
+# once the queue reaches the high watermark producers block until consumers
+# bring it back down to the low watermark (backpressure), so memory never grows
+# past maxsize
+# consumers can block in a thread with get_many or await get_many_async from
+# asyncio, stats() gives the throughput and how long producers and consumers
+# spent waiting
+# get_many returns an empty list once the queue is closed and drained, get has
+# no list to return so it raises QueueClosed (a queue.Empty) instead
+# ------------------------------------------------------------------------------
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+
+
+class QueueClosed(queue.Empty):
+    """Raised by BoundedQueue.get when the queue is closed and drained."""
+
+
+class BoundedQueue:
+    """Thread safe bounded queue on a deque with watermark backpressure."""
+
+    def __init__(self, maxsize=10_000, high_watermark=None, low_watermark=None):
+        self.maxsize = maxsize
+        self.high_watermark = high_watermark or maxsize
+        self.low_watermark = (self.high_watermark // 2 if low_watermark is None
+                              else low_watermark)
+        if not 0 <= self.low_watermark < self.high_watermark <= maxsize:
+            raise ValueError("Need 0 <= low_watermark < high_watermark <= maxsize")
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._async_waiters = []
+        self._paused = False
+        self._closed = False
+        self._started = time.monotonic()
+        self.put_count = 0
+        self.get_count = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+    def close(self):
+        """Stop accepting items, consumers still get what is left."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            self._wake_async_waiters()
+
+    def put(self, item, timeout=None):
+        self.put_many((item,), timeout)
+
+    def put_many(self, items, timeout=None):
+        """Put all items, blocking while the queue is over its watermark.
+
+        Raises queue.Full on timeout, any items already put stay in the queue.
+        """
+        items = list(items)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_full:
+            while items:
+                started = time.monotonic()
+                while not self._closed and (
+                        self._paused or len(self._items) >= self.maxsize):
+                    if not self._not_full.wait(self._remaining(deadline)):
+                        self.put_wait += time.monotonic() - started
+                        raise queue.Full
+                self.put_wait += time.monotonic() - started
+                if self._closed:
+                    raise ValueError("put to a closed queue")
+                space = self.maxsize - len(self._items)
+                self._items.extend(items[:space])
+                self.put_count += min(space, len(items))
+                del items[:space]
+                if len(self._items) >= self.high_watermark:
+                    self._paused = True
+                self._not_empty.notify_all()
+                self._wake_async_waiters()
+
+    def get(self, timeout=None):
+        """Get one item, raises QueueClosed if the queue is closed and empty."""
+        items = self.get_many(1, timeout)
+        if not items:
+            raise QueueClosed("get from a closed and empty queue")
+        return items[0]
+
+    def get_many(self, max_items=1000, timeout=None):
+        """Get up to max_items, an empty list means the queue was closed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_empty:
+            started = time.monotonic()
+            while not self._items and not self._closed:
+                if not self._not_empty.wait(self._remaining(deadline)):
+                    self.get_wait += time.monotonic() - started
+                    raise queue.Empty
+            self.get_wait += time.monotonic() - started
+            return self._take(max_items)
+
+    async def get_many_async(self, max_items=1000):
+        """Await up to max_items, an empty list means the queue was closed."""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                if self._items or self._closed:
+                    self.get_wait += time.monotonic() - started
+                    return self._take(max_items)
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def stats(self):
+        elapsed = time.monotonic() - self._started
+        return {
+            "size": len(self._items),
+            "put_count": self.put_count,
+            "get_count": self.get_count,
+            "put_wait": self.put_wait,
+            "get_wait": self.get_wait,
+            "throughput": self.get_count / elapsed if elapsed else 0.0,
+        }
+
+    def _take(self, max_items):
+        # the lock is held by the caller
+        items = [self._items.popleft()
+                 for _ in range(min(max_items, len(self._items)))]
+        self.get_count += len(items)
+        if self._paused and len(self._items) <= self.low_watermark:
+            self._paused = False
+            self._not_full.notify_all()
+        return items
+
+    def _wake_async_waiters(self):
+        # the lock is held by the caller
+        for loop, waiter in self._async_waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+        self._async_waiters.clear()
+
+    @staticmethod
+    def _remaining(deadline):
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+# ------------------------------------------------------------------------------
 # Default Dict
 # a default dict is initilised with function('default factory')
 # which takes no arguments and provides the default value for a nonexistent key
@@ -192,6 +1250,133 @@ deq = deque('abcdefg')
 from collections import defaultdict
 colours = defaultdict(int)
 # ------------------------------------------------------------------------------
+# defaultdict is perfect for group by, but with millions of different keys the
+# dict itself runs out of memory
+# GroupBy starts with a defaultdict and once it holds more than max_groups keys
+# it sorts them and spills them to a temp file (a sorted run), then carries on
+# with an empty dict, at the end the runs are merged back together by key
+# the aggregator says how to start a group, add a value to it and merge two
+# partial groups, there are SUM, COUNT, MIN, MAX and LIST or make your own
+# ------------------------------------------------------------------------------
+import heapq
+import pickle
+import tempfile
+from collections import namedtuple
+from operator import itemgetter
+
+Aggregator = namedtuple("Aggregator", ["factory", "add", "merge"])
+
+
+def _no_value():
+    return None
+
+
+def _add_min(state, value):
+    return value if state is None or value < state else state
+
+
+def _add_max(state, value):
+    return value if state is None or value > state else state
+
+
+def _count_one(state, value):
+    return state + 1
+
+
+def _add_to_list(state, value):
+    state.append(value)
+    return state
+
+
+def _add(state, value):
+    return state + value
+
+
+SUM = Aggregator(int, _add, _add)
+COUNT = Aggregator(int, _count_one, _add)
+MIN = Aggregator(_no_value, _add_min, _add_min)
+MAX = Aggregator(_no_value, _add_max, _add_max)
+LIST = Aggregator(list, _add_to_list, _add)
+
+
+class GroupBy:
+    """Group by aggregation that spills sorted runs to disk."""
+
+    def __init__(self, aggregator=SUM, max_groups=1_000_000):
+        self.aggregator = aggregator
+        self.max_groups = max_groups
+        self.groups = defaultdict(aggregator.factory)
+        self.runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, key, value=None):
+        groups = self.groups
+        groups[key] = self.aggregator.add(groups[key], value)
+        if len(groups) > self.max_groups:
+            self._spill()
+
+    def update(self, pairs):
+        for key, value in pairs:
+            self.add(key, value)
+
+    def results(self):
+        """Yield (key, aggregate) pairs sorted by key."""
+        if not self.runs:
+            yield from sorted(self.groups.items(), key=itemgetter(0))
+            return
+        self._spill()
+        merge = self.aggregator.merge
+        current_key = current = None
+        started = False
+        # merging by key only keeps equal keys in run order, so LIST keeps the
+        # order the values were added in
+        for key, state in heapq.merge(*(self._read_run(run)
+                                        for run in self.runs),
+                                      key=itemgetter(0)):
+            if started and key == current_key:
+                current = merge(current, state)
+                continue
+            if started:
+                yield current_key, current
+            current_key, current, started = key, state, True
+        if started:
+            yield current_key, current
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs.clear()
+
+    def _spill(self):
+        run = tempfile.TemporaryFile()
+        pickler = pickle.Pickler(run, protocol=pickle.HIGHEST_PROTOCOL)
+        for item in sorted(self.groups.items(), key=itemgetter(0)):
+            pickler.dump(item)
+        run.seek(0)
+        self.runs.append(run)
+        self.groups = defaultdict(self.aggregator.factory)
+
+    @staticmethod
+    def _read_run(run):
+        run.seek(0)
+        unpickler = pickle.Unpickler(run)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+
+with GroupBy(COUNT) as colour_counts:
+    colour_counts.update((colour, None) for colour in ["red", "blue", "red"])
+    dict(colour_counts.results())
+#>>> {'blue': 1, 'red': 2}
+# ------------------------------------------------------------------------------
 # Switch statement using dictionary
 # python doesnt have a switch keyword but you cna use a dict instead
 # Example to show, how switch can be implimented, not working example.
@@ -220,6 +1405,124 @@ def calculate_tax(country_name, amount):
 
 calculate_tax("zambia", 8000000)
 # ------------------------------------------------------------------------------
+# the dict switch is fine for one amount but for millions of payroll rows
+# walking the brackets and looking up the country again for every row adds up
+# below every country has a table of tax brackets (the rates here are just made
+# up examples) which compile_brackets turns once into a small function, the tax
+# for every bracket is a straight line so it is just a bisect to find the
+# bracket and one multiply and add
+# calculate_tax_bulk takes the countries and amounts as parallel sequences,
+# checks every country name once up front and then runs the compiled brackets
+# over all the rows in one pass, returning an array of the taxes, every row
+# still does one dict lookup for its country's compiled function
+# without numpy splitting the rows up by country and putting them back together
+# costs more than that lookup (about 25% slower when tried), so the rows are
+# done in their original order
+# compare_tax_dispatch times it against the dict switch above done per row,
+# with every country function walking its brackets
+# ------------------------------------------------------------------------------
+import timeit
+from array import array
+from bisect import bisect_right
+
+# (lower bound, marginal rate) for every bracket, lowest first
+TAX_BRACKETS = {
+    "tanzania": [(0, 0.0), (270_000, 0.08), (520_000, 0.20), (760_000, 0.25),
+                 (1_000_000, 0.30)],
+    "zambia": [(0, 0.0), (4_800, 0.20), (6_800, 0.30), (9_200, 0.37)],
+    "eritrea": [(0, 0.02), (2_400, 0.10), (6_000, 0.20), (14_400, 0.30)],
+}
+
+
+def compile_brackets(brackets):
+    """Turn a bracket table into a function that works out the tax."""
+    lowers = [lower for lower, _ in brackets]
+    # index 0 is for amounts below the first bracket, no tax
+    slopes = [0.0]
+    intercepts = [0.0]
+    owed = 0.0
+    for index, (lower, rate) in enumerate(brackets):
+        if index:
+            previous_lower, previous_rate = brackets[index - 1]
+            owed += (lower - previous_lower) * previous_rate
+        slopes.append(rate)
+        intercepts.append(owed - lower * rate)
+
+    def tax(amount):
+        index = bisect_right(lowers, amount)
+        return slopes[index] * amount + intercepts[index]
+
+    return tax
+
+
+COMPILED_TAX = {country: compile_brackets(brackets)
+                for country, brackets in TAX_BRACKETS.items()}
+
+
+def calculate_tax_bulk(country_names, amounts):
+    """Work out the tax for parallel sequences of countries and amounts."""
+    if len(country_names) != len(amounts):
+        raise ValueError("country_names and amounts must be the same length")
+    unknown = set(country_names).difference(COMPILED_TAX)
+    if unknown:
+        raise ValueError(f"No tax brackets for {', '.join(sorted(unknown))}")
+    compiled_tax = COMPILED_TAX
+    return array("d", [compiled_tax[country_name](amount)
+                       for country_name, amount in zip(country_names, amounts)])
+
+
+def walk_brackets(brackets, amount):
+    """Work out the tax of one amount by walking the brackets."""
+    tax = 0.0
+    for index, (lower, rate) in enumerate(brackets):
+        if amount <= lower:
+            break
+        upper = (brackets[index + 1][0] if index + 1 < len(brackets)
+                 else amount)
+        tax += (min(amount, upper) - lower) * rate
+    return tax
+
+
+def tanzania_tax(amount):
+    return walk_brackets(TAX_BRACKETS["tanzania"], amount)
+
+
+def zambia_tax(amount):
+    return walk_brackets(TAX_BRACKETS["zambia"], amount)
+
+
+def eritrea_tax(amount):
+    return walk_brackets(TAX_BRACKETS["eritrea"], amount)
+
+
+country_tax_per_call = {
+    "tanzania": tanzania_tax,
+    "zambia": zambia_tax,
+    "eritrea": eritrea_tax,
+}
+
+
+def compare_tax_dispatch(size=1_000_000, repeat=3):
+    """Time calculate_tax_bulk against the dict switch called once per row."""
+    countries = list(TAX_BRACKETS)
+    country_names = [countries[row % len(countries)] for row in range(size)]
+    amounts = array("d", (row * 7 % 2_000_000 for row in range(size)))
+
+    def per_call():
+        return [country_tax_per_call[country_name](amount)
+                for country_name, amount in zip(country_names, amounts)]
+
+    def bulk():
+        return calculate_tax_bulk(country_names, amounts)
+
+    for name, run in (("per call", per_call), ("bulk", bulk)):
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+        print(f"{name:>8}: {best * 1000:.1f} ms for {size} rows")
+
+
+if __name__ == "__main__":
+    compare_tax_dispatch()
+# ------------------------------------------------------------------------------
 # Merge two dictionaries
 
 salary_first = {"Lisa": 238900, "Ganesh": 8765000, "John": 3450000}
@@ -227,9 +1530,241 @@ salary_second = {"Albert": 3456000, "Arya": 987600}
 salary = salary_first.copy()
 salary.update(salary_second)
 # ------------------------------------------------------------------------------
+# copy() copies every key of the first dict on every merge, with big salary
+# maps and lots of merges that is a lot of copying just to read the result
+# collections.ChainMap already looks up a key in several dicts in order without
+# copying them, LayeredDict works the same way (it is a MutableMapping so pop,
+# popitem, setdefault and update all go through the methods below) except that
+# the dicts are given in the same order as copy() + update(), later ones win
+# writes and deletes go into its own top layer so the dicts you passed in are
+# never changed (copy on write), deletes are remembered as tombstones
+# iterating walks the layers one after the other and skips keys a higher layer
+# already has, len() is counted once (one walk over the keys, slower than copy()
+# but without the memory) and then kept up to date by the writes, so neither of
+# them builds the merged dict (change the dicts you passed in after
+# the first len() and the count is off, write through the LayeredDict instead)
+# flatten() gives you a real dict only when you actually need one
+# ------------------------------------------------------------------------------
+import timeit
+import tracemalloc
+from collections.abc import MutableMapping
+
+
+class LayeredDict(MutableMapping):
+    """Copy free read view over several dicts, later dicts win."""
+
+    def __init__(self, *dicts):
+        # maps is highest priority first like ChainMap.maps, maps[0] is ours
+        self.maps = [{}, *reversed(dicts)]
+        self._deleted = set()
+        self._len = None
+
+    def __getitem__(self, key):
+        if not self._deleted or key not in self._deleted:
+            for layer in self.maps:
+                if key in layer:
+                    return layer[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._deleted:
+            return False
+        return any(key in layer for layer in self.maps)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        if self._len is not None and key not in self:
+            self._len += 1
+        self._deleted.discard(key)
+        self.maps[0][key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.maps[0].pop(key, None)
+        self._deleted.add(key)
+        if self._len is not None:
+            self._len -= 1
+
+    def __iter__(self):
+        maps, deleted = self.maps, self._deleted
+        # lowest layer first so the keys come out in copy() + update() order
+        for depth in range(len(maps) - 1, -1, -1):
+            lower = maps[depth + 1:]
+            for key in maps[depth]:
+                if key in deleted:
+                    continue
+                for layer in lower:
+                    if key in layer:
+                        break
+                else:
+                    yield key
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
+
+    def __bool__(self):
+        for _ in self:
+            return True
+        return False
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.flatten()!r})"
+
+    def clear(self):
+        self.maps[0].clear()
+        for layer in self.maps[1:]:
+            self._deleted.update(layer)
+        self._len = 0
+
+    def copy(self):
+        """Cheap copy, only our own top layer and the tombstones are copied."""
+        layered = type(self).__new__(type(self))
+        layered.maps = [dict(self.maps[0]), *self.maps[1:]]
+        layered._deleted = set(self._deleted)
+        layered._len = self._len
+        return layered
+
+    __copy__ = copy
+
+    def new_child(self, child=None):
+        """New LayeredDict with child on top of everything in this one."""
+        layered = self.copy()
+        child = {} if child is None else child
+        layered.maps.insert(0, {})
+        layered.maps.insert(1, child)
+        layered._deleted.difference_update(child)
+        layered._len = None
+        return layered
+
+    def flatten(self):
+        """Merge the layers into a real dict."""
+        flat = {}
+        for layer in reversed(self.maps):
+            flat.update(layer)
+        for key in self._deleted:
+            flat.pop(key, None)
+        return flat
+
+
+salary = LayeredDict(salary_first, salary_second)
+salary["Arya"]
+#>>> 987600
+
+
+def compare_dict_merging(size=1_000_000, repeat=3):
+    """Compare copy() + update() with LayeredDict for time and memory."""
+    first = {f"user{index}": index for index in range(size)}
+    second = {f"user{index}": -index for index in range(0, size, 10)}
+
+    def copy_update():
+        merged = first.copy()
+        merged.update(second)
+        return merged
+
+    def layered():
+        return LayeredDict(first, second)
+
+    for name, merge in (("copy + update", copy_update),
+                        ("LayeredDict", layered)):
+        build = min(timeit.repeat(merge, number=1, repeat=repeat))
+        merged = merge()
+        lookup = min(timeit.repeat(lambda: merged["user500000"],
+                                   number=100_000, repeat=repeat)) / 100_000
+        # a fresh merge for every repeat so a cached len() is not reused
+        size_check = min(timeit.repeat("bool(merged), len(merged)",
+                                       setup="merged = merge()",
+                                       globals={"merge": merge},
+                                       number=1, repeat=repeat))
+        tracemalloc.start()
+        merged = merge()
+        bool(merged), len(merged)
+        memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:>13}: merge {build * 1000:.2f} ms, "
+              f"lookup {lookup * 1e9:.0f} ns, "
+              f"bool + len {size_check * 1000:.2f} ms, "
+              f"{memory / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    compare_dict_merging()
+# ------------------------------------------------------------------------------
 # Pretty Printing a dict
 import pprint
 
 pp = pprint.PrettyPrinter(indent=4)
 pp.pprint(colors)
 # ------------------------------------------------------------------------------
+# pprint builds the whole formatted string before printing anything, for a dump
+# of a few hundred MB that takes seconds and just as much memory again
+# stream_pprint walks the data and writes it out piece by piece to any file
+# like object (a file, sys.stdout, socket.makefile("w")), so memory does not
+# depend on the size of the data
+# max_depth stops at deeply nested containers and max_items only shows the first
+# N entries of each container, the rest is shown as "..." with how many were
+# left out, max_width cuts off very long strings and numbers
+# ------------------------------------------------------------------------------
+import sys
+from itertools import islice
+
+
+def stream_pprint(data, stream=None, indent=4, max_depth=None, max_items=None,
+                  max_width=None):
+    """Pretty print data to stream without building the whole string."""
+    stream = sys.stdout if stream is None else stream
+    write = stream.write
+
+    def short_repr(value):
+        if (max_width is not None and isinstance(value, (str, bytes))
+                and len(value) > max_width):
+            # only repr the part that gets shown, not the whole string
+            return repr(value[:max_width]) + "..."
+        text = repr(value)
+        if max_width is not None and len(text) > max_width:
+            return text[:max_width] + "..."
+        return text
+
+    def write_value(value, depth):
+        if isinstance(value, dict):
+            open_bracket, close_bracket, items = "{", "}", value.items()
+        elif isinstance(value, list):
+            open_bracket, close_bracket, items = "[", "]", value
+        elif isinstance(value, tuple):
+            open_bracket, close_bracket, items = "(", ")", value
+        elif isinstance(value, (set, frozenset)):
+            open_bracket, close_bracket, items = "{", "}", value
+        else:
+            write(short_repr(value))
+            return
+        if not value:
+            write(repr(value))
+            return
+        if max_depth is not None and depth >= max_depth:
+            write(f"{open_bracket}...{close_bracket}")
+            return
+        padding = " " * (indent * (depth + 1))
+        write(open_bracket + "\n")
+        shown = 0
+        for item in islice(items, max_items):
+            write(padding)
+            if isinstance(value, dict):
+                key, item = item
+                write(short_repr(key) + ": ")
+            write_value(item, depth + 1)
+            write(",\n")
+            shown += 1
+        if shown < len(value):
+            write(f"{padding}... ({len(value) - shown} more)\n")
+        write(" " * (indent * depth) + close_bracket)
+
+    write_value(data, 0)
+    write("\n")
+
+
+stream_pprint(colors, max_depth=3, max_items=20)
+# ------------------------------------------------------------------------------
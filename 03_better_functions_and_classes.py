@@ -61,6 +61,161 @@ def division(divident, divisor):
 
 num = divison(4, 0)
 # ------------------------------------------------------------------------------
+# with a StreamHandler on the logger every logger.error() writes to the stream
+# right there in the calling thread, so a slow disk or terminal slows down
+# division() as well
+# AsyncLogPipeline gives the logger a handler that only puts the record on a
+# bounded queue, a background writer thread takes the records off in batches,
+# formats them and writes a whole batch with one write and one flush
+# the handler merges msg % args right away (like QueueHandler.prepare) so a
+# list or dict you change after logging still shows up as it was, only the
+# Formatter layout is left to the writer
+# when the queue is more than sample_above full only every sample_every-th
+# record below ERROR is kept, the last error_reserve part of the queue only
+# takes ERROR and above so a flood of INFO cant push the errors out, and when
+# it is completely full records are dropped instead of making the caller wait
+# counters() tells you how many records were queued, sampled out, dropped and
+# flushed, anything logged after stop() counts as dropped
+# ------------------------------------------------------------------------------
+import atexit
+import copy
+import queue
+import sys
+import threading
+
+_STOP = object()
+
+
+class NonBlockingHandler(logging.Handler):
+    """Handler that hands records to an AsyncLogPipeline without waiting."""
+
+    def __init__(self, pipeline, level=logging.NOTSET):
+        super().__init__(level)
+        self.pipeline = pipeline
+
+    def emit(self, record):
+        try:
+            self.pipeline.offer(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, record):
+        """Copy of the record with message and traceback already rendered."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.pipeline.formatter.formatException(
+                record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class AsyncLogPipeline:
+    """Bounded log queue with a batching background writer thread."""
+
+    def __init__(self, stream=None, formatter=None, capacity=10_000,
+                 batch_size=512, sample_above=0.8, sample_every=10,
+                 error_reserve=0.1):
+        self.stream = sys.stderr if stream is None else stream
+        self.formatter = formatter or logging.Formatter()
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.sample_limit = int(capacity * sample_above)
+        self.sample_every = sample_every
+        self.error_limit = capacity - max(1, int(capacity * error_reserve))
+        self.handler = NonBlockingHandler(self)
+        self._queue = queue.Queue(capacity)
+        self._lock = threading.Lock()
+        self._seen_while_busy = 0
+        self._stopped = False
+        self._counters = {"queued": 0, "sampled_out": 0, "dropped": 0,
+                          "flushed": 0}
+        self._thread = threading.Thread(target=self._write_batches,
+                                        name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def offer(self, record):
+        """Queue a record, never blocks the caller."""
+        with self._lock:
+            if self._stopped:
+                self._counters["dropped"] += 1
+                return
+            if record.levelno < logging.ERROR:
+                size = self._queue.qsize()
+                if size >= self.error_limit:
+                    self._counters["dropped"] += 1
+                    return
+                if size >= self.sample_limit:
+                    self._seen_while_busy += 1
+                    if self._seen_while_busy % self.sample_every:
+                        self._counters["sampled_out"] += 1
+                        return
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self._counters["dropped"] += 1
+                return
+            self._counters["queued"] += 1
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def stop(self):
+        """Write out everything still queued and stop the writer thread."""
+        with self._lock:
+            self._stopped = True
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _write_batches(self):
+        get, get_nowait = self._queue.get, self._queue.get_nowait
+        while True:
+            batch = [get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(get_nowait())
+            except queue.Empty:
+                pass
+            stopping = batch[-1] is _STOP
+            records = batch[:-1] if stopping else batch
+            if records:
+                text = "".join([self._format(record) + "\n"
+                                for record in records])
+                try:
+                    self.stream.write(text)
+                    self.stream.flush()
+                except Exception:
+                    self.handler.handleError(records[0])
+                with self._lock:
+                    self._counters["flushed"] += len(records)
+            if stopping:
+                return
+
+    def _format(self, record):
+        try:
+            return self.formatter.format(record)
+        except Exception:
+            self.handler.handleError(record)
+            return ""
+
+
+logger = logging.getLogger(__name__)
+log_pipeline = AsyncLogPipeline(
+    formatter=logging.Formatter("%(name)s - %(levelname)s - %(message)s"))
+log_pipeline.handler.setLevel(logging.ERROR)
+logger.addHandler(log_pipeline.handler)
+
+
+def division(divident, divisor):
+    try:
+        return divident/divisor
+    except ZeroDivisionError:
+        logger.error("Zero Division Error")
+# ------------------------------------------------------------------------------
 # Unit Test
 #-------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
@@ -82,6 +237,143 @@ class SimpleTest(unittest.TestCase):
 def test_sum_numbers():
     assert func(3, 4) == 7
 # ------------------------------------------------------------------------------
+# Benchmarks
+# ------------------------------------------------------------------------------
+# tests tell you the code still works but not that it got slower
+# BenchmarkSuite times every registered function over a few input sizes, it
+# runs warmup calls first and then repeats the timing to get the min, median,
+# mean and standard deviation
+# save_baseline() writes the results to a JSON file and check() runs the suite
+# again and lists every function/size whose fastest time got slower than the
+# baseline by more than threshold (0.25 = 25% slower), the fastest time is used
+# as it is the one least thrown off by whatever else the machine is doing, the
+# BenchmarkTest below fails when there is a regression (pytest runs it too)
+# the other chapters cant be imported (their file names start with a digit) so
+# the functions they share with the suite live in timed_examples.py, the salary
+# rows are built in memory with csv.DictReader and the prints are thrown away
+# ------------------------------------------------------------------------------
+import csv
+import io
+import json
+import os
+import statistics
+import time
+
+from timed_examples import divide_numbers, process_salary, sort_users_by_name
+
+BENCHMARK_BASELINE = os.environ.get("BENCHMARK_BASELINE", "benchmarks.json")
+BENCHMARK_THRESHOLD = float(os.environ.get("BENCHMARK_THRESHOLD", "0.25"))
+
+
+class BenchmarkSuite:
+    """Times functions over parametrised input sizes and compares baselines."""
+
+    def __init__(self, warmup=3, repeat=7, min_time=0.01):
+        self.warmup = warmup
+        self.repeat = repeat
+        self.min_time = min_time
+        self.benchmarks = {}
+
+    def add(self, name, func, make_args, sizes):
+        """Register func, make_args(size) returns the tuple of args to call it with."""
+        self.benchmarks[name] = (func, make_args, sizes)
+
+    def time_one(self, func, args):
+        """Return the per call times of func(*args) for every repeat."""
+        for _ in range(self.warmup):
+            func(*args)
+        # call it enough times per repeat that the timer resolution doesnt matter
+        number = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(number):
+                func(*args)
+            if time.perf_counter() - started >= self.min_time:
+                break
+            number *= 2
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                func(*args)
+            timings.append((time.perf_counter() - started) / number)
+        return timings
+
+    def run(self):
+        """Run every benchmark, returns {name: {size: stats}}."""
+        results = {}
+        for name, (func, make_args, sizes) in self.benchmarks.items():
+            results[name] = {}
+            for size in sizes:
+                timings = self.time_one(func, make_args(size))
+                results[name][str(size)] = {
+                    "min": min(timings),
+                    "median": statistics.median(timings),
+                    "mean": statistics.mean(timings),
+                    "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+                }
+        return results
+
+    def save_baseline(self, path=BENCHMARK_BASELINE, results=None):
+        results = self.run() if results is None else results
+        with open(path, "w") as fwrite:
+            json.dump(results, fwrite, indent=4, sort_keys=True)
+        return results
+
+    def check(self, path=BENCHMARK_BASELINE, threshold=BENCHMARK_THRESHOLD):
+        """Return a list of regressions against the baseline in path."""
+        with open(path) as fread:
+            baseline = json.load(fread)
+        regressions = []
+        for name, sizes in self.run().items():
+            for size, stats in sizes.items():
+                before = baseline.get(name, {}).get(size)
+                if before is None:
+                    continue
+                slower = stats["min"] / before["min"] - 1
+                if slower > threshold:
+                    regressions.append(
+                        f"{name}[{size}] is {slower:.0%} slower "
+                        f"({before['min'] * 1e6:.2f}us -> "
+                        f"{stats['min'] * 1e6:.2f}us)")
+        return regressions
+
+
+def _users(size):
+    return ([{"first_name": f"User{index * 7919 % size}"}
+             for index in range(size)],)
+
+
+class _Discard:
+    """File like object that throws away everything written to it."""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _salary_rows(size):
+    text = "name,salary,birthday month\n" + "".join(
+        f"User{index},{1000 + index},November\n" for index in range(size))
+    # a list so every timed call reads all the rows again
+    return list(csv.DictReader(io.StringIO(text))), _Discard()
+
+
+suite = BenchmarkSuite()
+suite.add("sum_numbers", sum_numbers, lambda size: (size, size), [10, 10 ** 20])
+suite.add("sort_users_by_name", sort_users_by_name, _users, [100, 10_000])
+suite.add("divide_numbers", divide_numbers,
+          lambda size: (float(size), 7.0), [10])
+suite.add("process_salary", process_salary, _salary_rows, [1000])
+
+
+class BenchmarkTest(unittest.TestCase):
+    @unittest.skipUnless(os.path.exists(BENCHMARK_BASELINE), "no baseline")
+    def test_no_regressions(self):
+        self.assertEqual(suite.check(), [])
+# ------------------------------------------------------------------------------
 # Classes
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
@@ -167,6 +459,245 @@ class Employee(Person):
         self._age_last_recalculated = today
 
 # ------------------------------------------------------------------------------
+# Caching employee ages
+# ------------------------------------------------------------------------------
+# working out the age again for every employee object is wasteful when there
+# are hundreds of thousands of them, the ages only change when the day changes
+# AgeService keeps every birthday as a date ordinal in one array, works out all
+# the ages in one go and keeps them until the date changes
+# every Employee gets an index into the shared service and the age property
+# just reads its age out of the cached array, setting birthday writes the new
+# one into the arrays and when the employee is garbage collected its index goes
+# on a free list so the next employee reuses it instead of growing the arrays
+# ------------------------------------------------------------------------------
+import datetime
+import weakref
+from array import array
+
+
+class AgeService:
+    """Ages worked out for every birthday at once and cached for the day."""
+
+    def __init__(self, today=datetime.date.today):
+        self.today = today
+        self.birthdays = array("l")
+        self.ages = array("h")
+        self._calculated_on = None
+        self._free = []
+
+    def register(self, birthday):
+        """Add a birthday and return its index."""
+        if self._free:
+            index = self._free.pop()
+            self.update(index, birthday)
+            return index
+        self.birthdays.append(birthday.toordinal())
+        self.ages.append(self._age_on(self._calculated_on, birthday)
+                         if self._calculated_on else 0)
+        return len(self.birthdays) - 1
+
+    def update(self, index, birthday):
+        """Change the birthday at index."""
+        self.birthdays[index] = birthday.toordinal()
+        if self._calculated_on:
+            self.ages[index] = self._age_on(self._calculated_on, birthday)
+
+    def release(self, index):
+        """Give an index back so register can reuse it."""
+        self._free.append(index)
+
+    def age(self, index):
+        self._refresh()
+        return self.ages[index]
+
+    def all_ages(self):
+        self._refresh()
+        return self.ages
+
+    def _refresh(self):
+        today = self.today()
+        if today == self._calculated_on:
+            return
+        from_ordinal = datetime.date.fromordinal
+        self.ages = array("h", (self._age_on(today, from_ordinal(ordinal))
+                                for ordinal in self.birthdays))
+        self._calculated_on = today
+
+    @staticmethod
+    def _age_on(today, birthday):
+        age = today.year - birthday.year
+        if (today.month, today.day) < (birthday.month, birthday.day):
+            age -= 1
+        return age
+
+
+class Employee(Person):
+    POSITIONS = ("Superwiser", "Manager", "CEO", "Founder")
+    age_service = AgeService()
+
+    def __init__(self, name, id, department, birthday):
+        self.name = name
+        self.id = id
+        self.department = department
+        self._birthday = birthday
+        self._age_index = self.age_service.register(birthday)
+        weakref.finalize(self, self.age_service.release, self._age_index)
+
+    def __str__(self):
+        return "Name: " + self.name + "\nDepartment: " + self.department
+
+    @classmethod
+    def no_position_allowed(cls, position):
+        return [t for t in cls.POSITIONS if t != position]
+
+    @classmethod
+    def c_positions(cls, position):
+        return [t for t in cls.POSITIONS if t in position]
+
+    @property
+    def id_with_name(self):
+        return self.id, self.name
+
+    @property
+    def birthday(self):
+        return self._birthday
+
+    @birthday.setter
+    def birthday(self, birthday):
+        self._birthday = birthday
+        self.age_service.update(self._age_index, birthday)
+
+    @property
+    def age(self):
+        return self.age_service.age(self._age_index)
+# ------------------------------------------------------------------------------
+# Slotted employees
+# ------------------------------------------------------------------------------
+# every Employee carries a __dict__ and its own copy of the department string,
+# with __slots__ there is no __dict__ and departments and positions are stored
+# as small int codes into a shared Codes table, so each name is only kept once
+# load_rows builds thousands of employees per call straight from CSV or DB rows
+# without going through __init__ for every row
+# no_position_allowed is worked out once for every position when the class is
+# made and c_positions caches its answer per position, so neither of them scans
+# POSITIONS again on every call
+# ------------------------------------------------------------------------------
+import csv
+from functools import lru_cache
+
+
+class Codes:
+    """Interns strings as small int codes."""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.code(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def value(self, code):
+        return self.values[code]
+
+
+@lru_cache(maxsize=1024)
+def _c_positions(position):
+    return tuple(t for t in SlottedEmployee.POSITIONS if t in position)
+
+
+def _other_positions(positions):
+    return {position: tuple(t for t in positions if t != position)
+            for position in positions}
+
+
+class SlottedEmployee:
+    POSITIONS = ("Superwiser", "Manager", "CEO", "Founder")
+    DEPARTMENTS = Codes()
+    POSITION_CODES = Codes(POSITIONS)
+    _NOT_ALLOWED = _other_positions(POSITIONS)
+
+    __slots__ = ("name", "id", "_department", "_position")
+
+    def __init__(self, name, id, department, position=None):
+        self.name = name
+        self.id = id
+        self.department = department
+        self.position = position
+
+    def __str__(self):
+        return ("Name: " + self.name + "\nDepartment: "
+                + self.department)
+
+    @classmethod
+    def load_rows(cls, rows):
+        """Build employees from (name, id, department, position) rows."""
+        new = object.__new__
+        department_code = cls.DEPARTMENTS.code
+        position_code = cls.POSITION_CODES.code
+        employees = []
+        append = employees.append
+        for name, id, department, position in rows:
+            employee = new(cls)
+            employee.name = name
+            employee.id = id
+            employee._department = department_code(department)
+            employee._position = position_code(position) if position else -1
+            append(employee)
+        return employees
+
+    @classmethod
+    def load_csv(cls, csv_file, batch_size=10_000):
+        """Yield lists of batch_size employees from a csv file with a header."""
+        csv_reader = csv.DictReader(csv_file)
+        while True:
+            rows = [(row["name"], row["id"], row["department"],
+                     row.get("position"))
+                    for _, row in zip(range(batch_size), csv_reader)]
+            if not rows:
+                return
+            yield cls.load_rows(rows)
+
+    @classmethod
+    def no_position_allowed(cls, position):
+        try:
+            return list(cls._NOT_ALLOWED[position])
+        except KeyError:
+            return list(cls.POSITIONS)
+
+    @staticmethod
+    def c_positions(position):
+        return list(_c_positions(position))
+
+    @property
+    def department(self):
+        return self.DEPARTMENTS.value(self._department)
+
+    @department.setter
+    def department(self, department):
+        self._department = self.DEPARTMENTS.code(department)
+
+    @property
+    def position(self):
+        if self._position == -1:
+            return None
+        return self.POSITION_CODES.value(self._position)
+
+    @position.setter
+    def position(self, position):
+        self._position = self.POSITION_CODES.code(position) if position else -1
+
+    @property
+    def id_with_name(self):
+        return self.id, self.name
 # ------------------------------------------------------------------------------
 
 
@@ -216,6 +747,94 @@ class BookPriceCalculator:
     def standard_price(self):
         return self.pages * PER_PAGE_PRICE
 # ------------------------------------------------------------------------------
+# Pricing a whole catalogue
+# ------------------------------------------------------------------------------
+# making a BookPriceCalculator per title and asking each one for its price is
+# slow for millions of titles, BookCatalogue keeps the pages in one array and
+# the authors as codes (the Codes table from the slotted employees) and works
+# out every price in one pass
+# the price per page comes from BookPriceCalculator.PER_PAGE_PRICE (or the
+# calculator class you pass in), the prices are cached until that changes, then
+# they are all worked out again the next time you ask for them
+# price_to_book_ratios divides whole arrays and a book value of 0 or a nan value
+# gives a masked result (nan with valid set to 0) instead of a ZeroDivisionError
+# or a nan ratio that looks valid
+# ------------------------------------------------------------------------------
+import math
+from array import array
+from itertools import repeat
+from operator import mul
+
+
+class BookCatalogue:
+
+    def __init__(self, calculator=BookPriceCalculator):
+        self.calculator = calculator
+        self.pages = array("l")
+        self.authors = array("l")
+        self.author_codes = Codes()
+        self._prices = array("d")
+        self._priced_at = None
+
+    def __len__(self):
+        return len(self.pages)
+
+    def add(self, pages, author):
+        self.pages.append(pages)
+        self.authors.append(self.author_codes.code(author))
+        self._priced_at = None
+
+    def extend(self, books):
+        for pages, author in books:
+            self.add(pages, author)
+
+    def author(self, index):
+        return self.author_codes.value(self.authors[index])
+
+    @property
+    def per_page_price(self):
+        return self.calculator.PER_PAGE_PRICE
+
+    @property
+    def standard_prices(self):
+        """Price of every book, only worked out again when the price changes."""
+        per_page_price = self.per_page_price
+        if self._priced_at != per_page_price:
+            self._prices = array("d", map(mul, self.pages,
+                                          repeat(per_page_price)))
+            self._priced_at = per_page_price
+        return self._prices
+
+    def standard_price(self, index):
+        return self.standard_prices[index]
+
+    @staticmethod
+    def price_to_book_ratios(market_prices_per_share, book_values_per_share):
+        """Divide the arrays, returns (ratios, valid) with 0 and nan masked."""
+        if len(market_prices_per_share) != len(book_values_per_share):
+            raise ValueError("market prices and book values must be the same "
+                             "length")
+        ratios = array("d")
+        valid = array("b")
+        isnan = math.isnan
+        for market, book in zip(market_prices_per_share, book_values_per_share):
+            if book and not isnan(book) and not isnan(market):
+                ratios.append(market / book)
+                valid.append(1)
+            else:
+                ratios.append(math.nan)
+                valid.append(0)
+        return ratios, valid
+
+
+catalogue = BookCatalogue()
+catalogue.extend([(120, "Larry"), (300, "Sumit")])
+catalogue.standard_prices
+#>>> array('d', [960.0, 2400.0])
+BookPriceCalculator.PER_PAGE_PRICE = 10
+catalogue.standard_prices
+#>>> array('d', [1200.0, 3000.0])
+# ------------------------------------------------------------------------------
 
 # Use abstract class inheritance the pytonic way
 # ------------------------------------------------------------------------------
@@ -274,6 +893,189 @@ TypeError:
 "Can't instantiate abstract class concrte with abstract method taste"
 """
 # ------------------------------------------------------------------------------
+# Fast dispatch on ABCs
+# ------------------------------------------------------------------------------
+# isinstance() against an ABC goes through __subclasshook__ and the ABC caches,
+# so a chain of isinstance checks in a hot loop gets slow
+# TypeDispatch keeps a plain dict from the concrete type to the function for
+# it, so a call is one dict lookup on type(obj), the table is filled in when a
+# class is defined or registered (FruitMeta tells every TypeDispatch about it)
+# and any type not in the table yet is worked out once and then cached
+# registering a new function or a new virtual subclass works every known class
+# out again, so the table never has holes
+# calling through the TypeDispatch object costs about the same as a two step
+# isinstance chain (it only wins for longer chains), for hot loops use
+# function_for, it is the table's own __getitem__ so the lookup never runs any
+# python code unless the type is new (then resolve() works it out), e.g.
+# find = price.function_for; find(type(fruit))(fruit)
+# compare_dispatch() shows the difference
+# FruitMeta is still an ABCMeta, so the abstract methods are still enforced
+# ------------------------------------------------------------------------------
+import timeit
+import weakref
+from abc import ABCMeta, abstractmethod
+
+
+class _DispatchTable(dict):
+    """Type to function dict that resolves types it hasnt seen yet."""
+    __slots__ = ("dispatch",)
+
+    def __missing__(self, cls):
+        return self.dispatch.resolve(cls)
+
+
+class TypeDispatch:
+    """Call the function registered for the type of the first argument."""
+
+    _instances = weakref.WeakSet()
+    _classes = weakref.WeakSet()
+
+    def __init__(self):
+        self.implementations = {}
+        self.table = _DispatchTable()
+        self.table.dispatch = self
+        # the fast path, function_for(cls) gives the function for cls
+        self.function_for = self.table.__getitem__
+        TypeDispatch._instances.add(self)
+
+    def register(self, base):
+        def decorator(func):
+            self.implementations[base] = func
+            self.refresh()
+            return func
+        return decorator
+
+    def __call__(self, obj, *args):
+        return self.table[type(obj)](obj, *args)
+
+    def resolve(self, cls):
+        """Find, cache and return the most specific function for cls."""
+        self.table[cls] = self._find(cls)
+        return self.table[cls]
+
+    def refresh(self):
+        """Work out every cached and every known concrete class again."""
+        for cls in {*self.table, *TypeDispatch._classes}:
+            try:
+                self.table[cls] = self._find(cls)
+            except TypeError:
+                self.table.pop(cls, None)
+
+    def _find(self, cls):
+        for klass in cls.__mro__:
+            if klass in self.implementations:
+                break
+        else:
+            # virtual subclasses registered with an ABC are not in the mro
+            matches = [base for base in self.implementations
+                       if issubclass(cls, base)]
+            if not matches:
+                raise TypeError(f"No implementation for {cls.__name__}")
+            # the most specific base is a subclass of the most other matches
+            klass = max(matches, key=lambda base: sum(
+                issubclass(base, other) for other in matches))
+        return self.implementations[klass]
+
+    @classmethod
+    def class_defined(cls, new_class):
+        """Fill in the tables for a new concrete class."""
+        if getattr(new_class, "__abstractmethods__", None):
+            return
+        cls._classes.add(new_class)
+        for dispatch in cls._instances:
+            try:
+                dispatch.resolve(new_class)
+            except TypeError:
+                pass
+
+
+class FruitMeta(ABCMeta):
+    """ABCMeta that keeps the TypeDispatch tables up to date."""
+
+    def __init__(cls, name, bases, namespace, **kwargs):
+        super().__init__(name, bases, namespace, **kwargs)
+        TypeDispatch.class_defined(cls)
+
+    def register(cls, subclass):
+        subclass = super().register(subclass)
+        TypeDispatch.class_defined(subclass)
+        for dispatch in TypeDispatch._instances:
+            dispatch.refresh()
+        return subclass
+
+
+class Fruite(metaclass=FruitMeta):
+
+    @abstractmethod
+    def taste(self):
+        pass
+
+    @abstractmethod
+    def originated(self):
+        pass
+
+
+class Apple(Fruite):
+    def taste(self):
+        return "Sweet"
+
+    def originated(self):
+        return "Central Asia"
+
+
+class Lemon(Fruite):
+    def taste(self):
+        return "Sour"
+
+    def originated(self):
+        return "Asia"
+
+
+price = TypeDispatch()
+
+
+@price.register(Fruite)
+def fruit_price(fruit):
+    return 1.0
+
+
+@price.register(Apple)
+def apple_price(apple):
+    return 0.5
+
+
+def price_with_isinstance(fruit):
+    if isinstance(fruit, Apple):
+        return apple_price(fruit)
+    if isinstance(fruit, Fruite):
+        return fruit_price(fruit)
+    raise TypeError(f"No implementation for {type(fruit).__name__}")
+
+
+def compare_dispatch(number=1_000_000):
+    """Time TypeDispatch against a chain of isinstance checks."""
+    fruits = [Apple(), Lemon()] * (number // 2)
+    function_for = price.function_for
+
+    def with_isinstance():
+        return [price_with_isinstance(fruit) for fruit in fruits]
+
+    def with_dispatch():
+        return [price(fruit) for fruit in fruits]
+
+    def with_function_for():
+        return [function_for(type(fruit))(fruit) for fruit in fruits]
+
+    for name, run in (("isinstance", with_isinstance),
+                      ("TypeDispatch", with_dispatch),
+                      ("function_for", with_function_for)):
+        best = min(timeit.repeat(run, number=1, repeat=3))
+        print(f"{name:>12}: {best * 1000:.1f} ms for {number} calls")
+
+
+if __name__ == "__main__":
+    compare_dispatch()
+# ------------------------------------------------------------------------------
 
 
 # Use @classmethod to access class state
@@ -312,3 +1114,155 @@ data = User.using_string("Larry Page")
 data = User.using_json(json_obj)
 data = User.using_file_obj(file_obj)
 # ------------------------------------------------------------------------------
+# Making millions of users
+# ------------------------------------------------------------------------------
+# the class method constructors above parse one record into one object, for
+# millions of users from a newline delimited JSON file or a flat "First Last"
+# file you want to stream the file and parse it a batch of lines at a time
+# iter_* yield User objects lazily, read_columns skips the objects altogether
+# and gives you UserColumns batches (a list per field)
+# parse_file_parallel splits the file into byte ranges that start and end on a
+# newline, parses every range in a worker process into columns and gives the
+# batches back in file order
+# the bulk constructors take a binary file object, wrap a bytes buffer in
+# io.BytesIO to use them on one
+# names are split on the first run of whitespace, a name with only one word gets
+# an empty last name
+# ------------------------------------------------------------------------------
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+class UserColumns:
+    """A batch of users kept as one list per field."""
+    __slots__ = ("first_names", "last_names")
+
+    def __init__(self, first_names=None, last_names=None):
+        self.first_names = first_names or []
+        self.last_names = last_names or []
+
+    def __len__(self):
+        return len(self.first_names)
+
+    def users(self, cls):
+        return map(cls, self.first_names, self.last_names)
+
+
+def _split_name(name):
+    first, *last = name.split(None, 1)
+    return first, last[0] if last else ""
+
+
+def _parse_string_lines(lines):
+    columns = UserColumns()
+    first_names, last_names = columns.first_names, columns.last_names
+    for line in lines:
+        line = line.strip()
+        if line:
+            first, last = _split_name(line.decode())
+            first_names.append(first)
+            last_names.append(last)
+    return columns
+
+
+def _parse_json_lines(lines):
+    columns = UserColumns()
+    first_names, last_names = columns.first_names, columns.last_names
+    loads = json.loads
+    for line in lines:
+        if line.strip():
+            record = loads(line)
+            first_names.append(record["first_name"])
+            last_names.append(record["last_name"])
+    return columns
+
+
+PARSERS = {"string": _parse_string_lines, "json": _parse_json_lines}
+
+
+def _parse_range(file_name, start, end, kind):
+    with open(file_name, "rb") as fread:
+        fread.seek(start)
+        return PARSERS[kind](fread.read(end - start).splitlines())
+
+
+def _newline_ranges(file_name, parts):
+    size = os.path.getsize(file_name)
+    bounds = []
+    start = 0
+    with open(file_name, "rb") as fread:
+        for part in range(1, parts + 1):
+            end = size * part // parts
+            if end < size:
+                fread.seek(end)
+                fread.readline()
+                end = fread.tell()
+            if end > start:
+                bounds.append((start, end))
+                start = end
+    return bounds
+
+
+class User:
+
+    def __init__(self, first_name, last_name):
+        self.first_name = first_name
+        self.last_name = last_name
+
+    @classmethod
+    def using_string(cls, names_str):
+        return cls(*_split_name(names_str))
+
+    @classmethod
+    def using_json(cls, obj_json):
+        record = json.loads(obj_json)
+        return cls(record["first_name"], record["last_name"])
+
+    @classmethod
+    def using_file_obj(cls, file_obj):
+        return cls.using_json(file_obj.read())
+
+    @classmethod
+    def read_columns(cls, file_obj, kind="json", batch_size=10_000):
+        """Yield UserColumns batches from a binary file object."""
+        parse = PARSERS[kind]
+        while True:
+            lines = list(islice(file_obj, batch_size))
+            if not lines:
+                return
+            yield parse(lines)
+
+    @classmethod
+    def iter_json_lines(cls, file_obj, batch_size=10_000):
+        """Lazily yield a User for every line of a newline delimited JSON file."""
+        for columns in cls.read_columns(file_obj, "json", batch_size):
+            yield from columns.users(cls)
+
+    @classmethod
+    def iter_strings(cls, file_obj, batch_size=10_000):
+        """Lazily yield a User for every "First Last" line of a file."""
+        for columns in cls.read_columns(file_obj, "string", batch_size):
+            yield from columns.users(cls)
+
+    @classmethod
+    def parse_file_parallel(cls, file_name, kind="json", workers=None,
+                            chunk_size=64 * 2 ** 20):
+        """Yield UserColumns for a big file parsed on a process pool."""
+        parts = max(1, os.path.getsize(file_name) // chunk_size)
+        bounds = _newline_ranges(file_name, parts)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(_parse_range,
+                                    [file_name] * len(bounds),
+                                    [start for start, _ in bounds],
+                                    [end for _, end in bounds],
+                                    [kind] * len(bounds))
+
+
+users = User.iter_json_lines(io.BytesIO(b'{"first_name": "Larry", '
+                                        b'"last_name": "Page"}\n'))
+next(users).first_name
+#>>> Larry
+# ------------------------------------------------------------------------------
@@ -1,3 +1,5 @@
+# scratch copy of the logging notes, the non blocking AsyncLogPipeline version
+# of this setup lives in 03_better_functions_and_classes.py
 # Import logging module
 import logging
 
@@ -0,0 +1,38 @@
+"""Example functions shared by the chapter notes and the benchmark suite.
+
+The chapter files cant be imported (their names start with a digit), so the
+functions the benchmarks time live here and the notes import them from here.
+"""
+
+
+def get_user_name(users):
+    """Get name of the user in lower case"""
+    return users["first_name"].lower()
+
+
+def sort_users_by_name(users):
+    """Sort the users by their lower case first name."""
+    return sorted(users, key=get_user_name)
+
+
+def process_salary(csv_reader, out=None):
+    """Process salary of user from csv file."""
+    line_count = 0
+    for row in csv_reader:
+        if line_count == 0:
+            print(f'Column names are {", ".join(row)}', file=out)
+            line_count += 1
+        print(f'\t{row["name"]} salary: {row["salary"]}', file=out)
+        line_count += 1
+    print(f'Completed {line_count} lines.', file=out)
+
+
+def divide_numbers(first, second):
+    if isinstance(first, int) and isinstance(second, int):
+        raise ValueError("Value should be int")
+
+    try:
+        return first/second
+    except ZeroDivisionError:
+        print("Value should not be zero")
+        raise